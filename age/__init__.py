@@ -31,9 +31,37 @@ def __load_doc__(filename = "__doc__.txt"):
 
 __version__ = "0.1"
 __doc__ = __load_doc__()
-__all__ = ["Descriptor", "Genome", "Device", "Population", "Agent"]
+__all__ = ["Descriptor", "Genome", "Device", "Population", "Agent",
+           "Aligner", "PythonAligner", "NumpyAligner", "PrunedAligner",
+           "get_aligner",
+           "LRUCache", "Tokenizer",
+           "Mutator", "CoME", "ProcessEvaluator", "EvaluationTimeout",
+           "WorkerPopulation",
+           "Crossover", "OnePointCrossover", "TwoPointCrossover",
+           "HomologousCrossover", "get_crossover",
+           "Selection", "RouletteWheel", "StochasticUniversal", "Tournament",
+           "get_selection",
+           "CheckpointWriter", "CheckpointReader", "save_checkpoint", "iter_checkpoint",
+           "AgentView", "PopulationArchive", "write_archive",
+           "DeltaWriter", "DeltaReader", "Islands",
+           "SteadyState", "VictimPolicy", "WorstVictim", "OldestVictim",
+           "RandomVictim", "TournamentVictim", "Stats", "NullStats"]
 
 # import classes
+from .alignment import *
+from .cache import *
+from .stats import *
+from .tokenizer import *
+from .mutation import *
+from .come import *
+from .crossover import *
 from .descriptor import *
 from .genome import *
+from .selection import *
 from .population import *
+from .parallel import *
+from .checkpoint import *
+from .archive import *
+from .delta import *
+from .island import *
+from .steady import *
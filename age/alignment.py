@@ -0,0 +1,504 @@
+# age/alignment.py
+#  pyAGE - A Python implementation of the Analog Genetic Encoding
+#  Copyright (C) 2010  Janosch Gräf
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+""" Local alignment (Smith-Waterman) backends used for terminal scoring.
+
+    All backends compute the same score: the maximum over the dynamic
+    programming table
+
+        H[i][j] = max(0,
+                      H[i-1][j-1] + w(a[i], b[j]),  # match/mismatch
+                      H[i-1][j]   + w(a[i], None),  # deletion
+                      H[i][j-1]   + w(None, b[j]))  # insertion
+
+    with H[0][*] = H[*][0] = 0. Without a scoring matrix a match scores 2, a
+    mismatch or a gap scores -1. PrunedAligner approximates this score
+    within documented bounds. """
+
+from timeit import default_timer
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class Aligner:
+    """ Base class of the alignment backends. A backend is created per
+        descriptor and implements align(a, b). """
+
+    name = None
+
+    def __init__(self, desc):
+        self.desc = desc
+        self.symbols = dict(((c, i) for i, c in enumerate(desc.alphabet)))
+        b = len(desc.alphabet)
+        scoring = desc.scoring
+        if (scoring==None):
+            self.substitution = [[2 if i==j else -1 for j in range(b)] for i in range(b)]
+            self.deletion = [-1]*b
+            self.insertion = [-1]*b
+        else:
+            # an optional last row/column holds the gap scores
+            self.substitution = [list(scoring[i][:b]) for i in range(b)]
+            if (len(scoring)>b):
+                self.deletion = [scoring[i][b] for i in range(b)]
+                self.insertion = [scoring[b][j] for j in range(b)]
+            else:
+                self.deletion = [-1.0]*b
+                self.insertion = [-1.0]*b
+        self.integral = (scoring==None)
+        # with a symmetric scoring the order of the sequences does not matter
+        self.symmetric = self.deletion==self.insertion \
+                     and all((self.substitution[i][j]==self.substitution[j][i] for i in range(b) for j in range(b)))
+        # (substitution, deletion, insertion) tables of the pair (a, b), and
+        # of the swapped pair (b, a), see orient()
+        self.tables = (self.substitution, self.deletion, self.insertion)
+        self.swapped_tables = ([list(column) for column in zip(*self.substitution)], self.insertion, self.deletion)
+        # scores may be shared between descriptors, so they are cached by
+        # scoring matrix too
+        self.cache = desc.get_alignment_cache()
+        self.cache_key = desc.scoring
+        # number of alignments done by score() and score_many(), and the
+        # seconds spent on them if timed, see age.stats
+        self.alignments = 0
+        self.seconds = 0.0
+
+    def indices(self, s):
+        """ Translate a sequence into a list of alphabet indices. """
+        if (type(s)==bytes):
+            # already encoded
+            return s
+        symbols = self.symbols
+        return [symbols[c] for c in s]
+
+    def orient(self, a, b):
+        """ Returns (a, b, tables) with the shorter sequence first and the
+            tables to align them with. If the sequences are swapped, so are
+            the tables, so an asymmetric scoring gives the same score. """
+        if (len(b)<len(a)):
+            return b, a, self.swapped_tables
+        return a, b, self.tables
+
+    def align(self, a, b):
+        raise NotImplementedError()
+
+    def align_many(self, pairs):
+        """ Returns the scores of a list of (a, b) pairs. """
+        return [self.align(a, b) for a, b in pairs]
+
+    def score(self, a, b):
+        cache = self.cache
+        if (cache==None):
+            self.alignments += 1
+            if (not self.desc._timed):
+                return self.align(a, b)
+            start = default_timer()
+            score = self.align(a, b)
+            self.seconds += default_timer()-start
+            return score
+        if (self.symmetric and b<a):
+            a, b = b, a
+        key = (self.cache_key, a, b)
+        score = cache.get(key)
+        if (score==None):
+            self.alignments += 1
+            if (not self.desc._timed):
+                score = self.align(a, b)
+            else:
+                start = default_timer()
+                score = self.align(a, b)
+                self.seconds += default_timer()-start
+            cache.put(key, score)
+        return score
+
+    def score_many(self, pairs):
+        """ Scores a list of (a, b) pairs in one batch; duplicate and cached
+            pairs are aligned only once. """
+        keys = []
+        unique = {}
+        for a, b in pairs:
+            if (self.symmetric and b<a):
+                a, b = b, a
+            keys.append((a, b))
+            unique[(a, b)] = None
+        cache = self.cache
+        if (cache!=None):
+            scoring = self.cache_key
+            for key in unique:
+                unique[key] = cache.get((scoring, key[0], key[1]))
+        todo = [key for key, score in unique.items() if score==None]
+        self.alignments += len(todo)
+        if (not self.desc._timed):
+            scores = self.align_many(todo)
+        else:
+            start = default_timer()
+            scores = self.align_many(todo)
+            self.seconds += default_timer()-start
+        for key, score in zip(todo, scores):
+            unique[key] = score
+            if (cache!=None):
+                cache.put((scoring, key[0], key[1]), score)
+        return [unique[key] for key in keys]
+
+
+class PythonAligner(Aligner):
+    """ Reference implementation, filling the table row by row. """
+
+    name = "python"
+
+    def align(self, a, b):
+        # let smaller string be a, since we dont store all lines
+        a, b, (substitution, deletion, insertion) = self.orient(a, b)
+        a = self.indices(a)
+        b = self.indices(b)
+        insertion = [insertion[y] for y in b]
+
+        score = 0
+        last = [0]*(len(b)+1)
+        for x in a:
+            s = substitution[x]
+            d = deletion[x]
+            line = [0]
+            for j in range(len(b)):
+                h = max(0,                    # empty suffix
+                        last[j]+s[b[j]],      # match/mismatch
+                        last[j+1]+d,          # deletion
+                        line[j]+insertion[j]) # insertion
+                if (h>score):
+                    score = h
+                line.append(h)
+            last = line
+        return score
+
+
+class NumpyAligner(Aligner):
+    """ Vectorized implementation sweeping the table along its
+        anti-diagonals, whose cells do not depend on each other. Only the
+        last two anti-diagonals are kept, so memory stays linear in the
+        length of the sequences. Small tables are handed to the reference
+        implementation, since the NumPy call overhead dominates there. """
+
+    name = "numpy"
+    min_cells = 2048
+    max_batch_cells = 1<<20
+
+    def __init__(self, desc):
+        if (numpy==None):
+            raise ImportError("NumpyAligner requires numpy")
+        Aligner.__init__(self, desc)
+        self.dtype = numpy.int64 if self.integral else numpy.float64
+        self.tables = tuple((numpy.array(t, dtype = self.dtype) for t in self.tables))
+        self.swapped_tables = tuple((numpy.array(t, dtype = self.dtype) for t in self.swapped_tables))
+        self.lookup = numpy.zeros(256, dtype = numpy.intp)
+        self.ascii = all((ord(c)<256 for c in desc.alphabet))
+        for c, i in self.symbols.items():
+            if (ord(c)<256):
+                self.lookup[ord(c)] = i
+        self.fallback = PythonAligner(desc)
+
+    def indices(self, s):
+        if (type(s)==bytes):
+            return numpy.frombuffer(s, dtype = numpy.uint8)
+        if (self.ascii and type(s)==str):
+            return self.lookup[numpy.frombuffer(s.encode("latin-1"), dtype = numpy.uint8)]
+        return numpy.array(Aligner.indices(self, s), dtype = numpy.intp)
+
+    def align(self, a, b):
+        if (len(a)*len(b)<self.min_cells):
+            return self.fallback.align(a, b)
+        a, b, (substitution, deletion, insertion) = self.orient(a, b)
+        n, m = len(a), len(b)
+
+        A = self.indices(a)
+        # B is reversed, so the cells (i, d-i) of an anti-diagonal d read
+        # the ascending slice B[m-d+i]
+        B = self.indices(b)[::-1].copy()
+        D = deletion[A]
+        I = insertion[B]
+
+        # anti-diagonals d-2, d-1 and d hold cell (i, d-i) at position i;
+        # cells outside of the table are never written and stay zero
+        h2 = numpy.zeros(n+1, dtype = self.dtype)
+        h1 = numpy.zeros(n+1, dtype = self.dtype)
+        h0 = numpy.zeros(n+1, dtype = self.dtype)
+        best = numpy.zeros(n+1, dtype = self.dtype)
+        maximum = numpy.maximum
+        for d in range(2, n+m+1):
+            lo = max(1, d-m)
+            hi = min(n, d-1)
+            k = m-d
+            h = h0[lo:hi+1]
+            numpy.add(h2[lo-1:hi], substitution[A[lo-1:hi], B[k+lo:k+hi+1]], out = h) # match/mismatch
+            maximum(h, h1[lo-1:hi]+D[lo-1:hi], out = h)                              # deletion
+            maximum(h, h1[lo:hi+1]+I[k+lo:k+hi+1], out = h)                          # insertion
+            maximum(h, 0, out = h)                                                   # empty suffix
+            maximum(best[lo:hi+1], h, out = best[lo:hi+1])
+            h2, h1, h0 = h1, h0, h2
+        score = best.max()
+        return int(score) if self.integral else float(score)
+
+    def align_many(self, pairs):
+        # let smaller string be a, and batch pairs of similar size so that
+        # padding stays below 50%; swapped pairs of an asymmetric scoring
+        # need the swapped tables and are batched separately
+        def size_class(l):
+            c = 4
+            while (c<l):
+                c += c//2
+            return c
+        buckets = {}
+        for k, (a, b) in enumerate(pairs):
+            swapped = len(b)<len(a) and not self.symmetric
+            a, b, tables = self.orient(a, b)
+            if (len(a)>0):
+                key = (swapped, size_class(len(a)), size_class(len(b)))
+                buckets.setdefault(key, []).append((k, (a, b)))
+        scores = [0]*len(pairs)
+        for (swapped, n, m), bucket in buckets.items():
+            tables = self.swapped_tables if swapped else self.tables
+            size = max(1, self.max_batch_cells//(n+m+1))
+            for i in range(0, len(bucket), size):
+                self.align_batch(bucket[i:i+size], scores, tables)
+        return scores
+
+    def align_batch(self, batch, scores, tables = None):
+        """ Aligns all pairs of 'batch' (a list of (index, (a, b)) with
+            len(a)<=len(b)) at once and stores the scores in 'scores'. The
+            anti-diagonals are padded to the largest pair; padding cells
+            never feed into real cells and are masked out of the maximum. """
+        substitution, deletion, insertion = tables if tables!=None else self.tables
+        K = len(batch)
+        na = numpy.array([len(p[0]) for k, p in batch])
+        nb = numpy.array([len(p[1]) for k, p in batch])
+        n, m = na.max(), nb.max()
+        # the batch is the innermost axis, so every step works on
+        # contiguous memory; B is reversed as in align()
+        A = numpy.zeros((n, K), dtype = numpy.intp)
+        B = numpy.zeros((m, K), dtype = numpy.intp)
+        indices = {}
+        for r, (k, (a, b)) in enumerate(batch):
+            if (a not in indices):
+                indices[a] = self.indices(a)
+            if (b not in indices):
+                indices[b] = self.indices(b)
+            A[:len(a), r] = indices[a]
+            B[m-len(b):, r] = indices[b][::-1]
+        D = deletion[A]
+        I = insertion[B]
+        # cell (i, j) of pair r is real if i<=na[r] and j<=nb[r]; the mask
+        # of j is reversed like B
+        real_a = numpy.arange(n+1)[:, None]<=na
+        real_b = (m-numpy.arange(m+1))[:, None]<=nb
+
+        h2 = numpy.zeros((n+1, K), dtype = self.dtype)
+        h1 = numpy.zeros((n+1, K), dtype = self.dtype)
+        h0 = numpy.zeros((n+1, K), dtype = self.dtype)
+        best = numpy.zeros((n+1, K), dtype = self.dtype)
+        maximum = numpy.maximum
+        for d in range(2, n+m+1):
+            lo = max(1, d-m)
+            hi = min(n, d-1)
+            k = m-d
+            h = h0[lo:hi+1]
+            numpy.add(h2[lo-1:hi], substitution[A[lo-1:hi], B[k+lo:k+hi+1]], out = h)
+            maximum(h, h1[lo-1:hi]+D[lo-1:hi], out = h)
+            maximum(h, h1[lo:hi+1]+I[k+lo:k+hi+1], out = h)
+            maximum(h, 0, out = h)
+            real = real_a[lo:hi+1] & real_b[k+lo:k+hi+1]
+            maximum(best[lo:hi+1], numpy.where(real, h, 0), out = best[lo:hi+1])
+            h2, h1, h0 = h1, h0, h2
+
+        best = best.max(axis = 0)
+        for r, (k, p) in enumerate(batch):
+            scores[k] = int(best[r]) if self.integral else float(best[r])
+
+
+class PrunedAligner(Aligner):
+    """ Approximate alignment for terminal scoring, where weights are only
+        used above a similarity threshold. Each option trades exactness for
+        speed with the following bounds relative to the exact score S of an
+        (a, b) pair, where a is the shorter sequence, n = len(a) and
+        m = len(b):
+
+        band       Only the diagonals -band <= j-i <= m-n+band of the table
+                   are filled. The result is the best alignment within the
+                   band, so 0 <= S-result <= S, and the result is exact if an
+                   optimal alignment stays within the band (e.g. two
+                   terminals of the same length which differ by at most
+                   'band' net insertions or deletions before any point of
+                   the alignment).
+
+        threshold  Threshold t of the terminal score 2*S/(n+m). Filling the
+                   table stops once no alignment can score more than the
+                   raw limit t*(n+m)/2 anymore, since every further row adds
+                   at most the highest match or deletion score. If the
+                   terminal score exceeds t the result is exact (or, with a
+                   band, the banded score), otherwise the result is a lower
+                   bound of S, so the error is confined to terminal scores
+                   of at most t.
+
+        seed       Length k of the seeds. Pairs sharing no k-mer are not
+                   aligned and score 0. Without a common k-mer, runs of
+                   identical columns are shorter than k, and each run is
+                   separated from the next by a column costing at least
+                   'penalty' (the smallest mismatch or gap cost), so
+                   0 <= S <= seed_bound(n). If this bound does not exceed
+                   the threshold limit, skipping the pair is exact.
+
+        Threshold and seeds need negative mismatch and gap scores. Pairs
+        without band and threshold are aligned by the exact backend
+        'exact'. """
+
+    name = "pruned"
+
+    def __init__(self, desc, exact = None, band = None, threshold = None, seed = None):
+        Aligner.__init__(self, desc)
+        self.exact = exact if exact!=None else get_aligner(desc)
+        self.band = band
+        self.threshold = threshold
+        self.seed = seed
+        # pruned scores must not be mixed up with exact ones
+        self.cache_key = (desc.scoring, band, threshold, seed)
+        b = len(self.substitution)
+        self.top = max((self.substitution[i][i] for i in range(b)))
+        # largest gain of a row (in either order of the sequences), and the
+        # smallest cost of a column which is not a match of identical symbols
+        self.gain = max([0, self.top]+self.deletion+self.insertion)
+        self.penalty = -max([self.substitution[i][j] for i in range(b) for j in range(b) if i!=j]
+                            +self.deletion+self.insertion)
+        if ((threshold!=None or seed!=None) and self.penalty<=0):
+            raise ValueError("Threshold and seed pruning need negative mismatch and gap scores")
+        # number of pairs skipped by seeds and stopped by the threshold
+        self.skipped = 0
+        self.stopped = 0
+
+    def seed_bound(self, n):
+        """ Upper bound of the score of a sequence of length 'n' and any
+            sequence sharing no seed with it. """
+        k = self.seed
+        if (k<2):
+            return 0
+        # r runs of at most k-1 identical columns, separated by r-1 columns
+        return max((min(r*(k-1), n)*self.top-(r-1)*self.penalty for r in range(1, n//(k-1)+2)))
+
+    def shares_seed(self, a, b):
+        k = self.seed
+        seeds = set((a[i:i+k] for i in range(len(a)-k+1)))
+        for j in range(len(b)-k+1):
+            if (b[j:j+k] in seeds):
+                return True
+        return False
+
+    def prefilter(self, a, b):
+        """ Returns the score of a pair which needs no alignment, or None. """
+        n = len(a)
+        if (n==0):
+            return 0
+        if (self.threshold!=None and n*self.gain<=self.threshold*(n+len(b))/2.0):
+            # even a perfect alignment stays below the threshold
+            self.stopped += 1
+            return 0
+        if (self.seed!=None and not self.shares_seed(a, b)):
+            self.skipped += 1
+            return 0
+        return None
+
+    def align(self, a, b):
+        x, y, tables = self.orient(a, b)
+        score = self.prefilter(x, y)
+        if (score!=None):
+            return score
+        if (self.band==None and self.threshold==None):
+            return self.exact.align(a, b)
+        return self.align_pruned(x, y, tables)
+
+    def align_many(self, pairs):
+        scores = [0]*len(pairs)
+        exact = []
+        for k, (a, b) in enumerate(pairs):
+            a, b, tables = self.orient(a, b)
+            score = self.prefilter(a, b)
+            if (score!=None):
+                scores[k] = score
+            elif (self.band==None and self.threshold==None):
+                exact.append(k)
+            else:
+                scores[k] = self.align_pruned(a, b, tables)
+        # the remaining pairs are aligned in one batch
+        for k, score in zip(exact, self.exact.align_many([pairs[k] for k in exact])):
+            scores[k] = score
+        return scores
+
+    def align_pruned(self, a, b, tables = None):
+        """ Row by row alignment with band and threshold (len(a)<=len(b)),
+            with the tables returned by orient(). """
+        substitution, deletion, insertion = tables if tables!=None else self.tables
+        n, m = len(a), len(b)
+        a = self.indices(a)
+        b = self.indices(b)
+        insertion = [insertion[y] for y in b]
+        w = self.band if self.band!=None else m
+        limit = self.threshold*(n+m)/2.0 if self.threshold!=None else None
+        gain = self.gain
+
+        score = 0
+        last = [0]*(m+1)
+        for i in range(1, n+1):
+            x = a[i-1]
+            s = substitution[x]
+            d = deletion[x]
+            # cells outside of the band stay zero
+            line = [0]*(m+1)
+            lo = max(1, i-w)
+            hi = min(m, i+m-n+w)
+            row = 0
+            for j in range(lo, hi+1):
+                h = max(0,                        # empty suffix
+                        last[j-1]+s[b[j-1]],      # match/mismatch
+                        last[j]+d,                # deletion
+                        line[j-1]+insertion[j-1]) # insertion
+                if (h>row):
+                    row = h
+                line[j] = h
+            if (row>score):
+                score = row
+            if (limit!=None and max(score, row+(n-i)*gain)<=limit):
+                self.stopped += 1
+                return score
+            last = line
+        return score
+
+
+ALIGNERS = {"python": PythonAligner,
+            "numpy": NumpyAligner}
+
+def get_aligner(desc, backend = None):
+    """ Create the alignment backend 'backend' for descriptor 'desc'.
+        'backend' may be a name from ALIGNERS or an Aligner subclass; if it is
+        None, the fastest available backend is used. """
+    if (backend==None):
+        backend = "numpy" if numpy!=None else "python"
+    if (type(backend)==str):
+        try:
+            backend = ALIGNERS[backend]
+        except KeyError:
+            raise ValueError("Unknown alignment backend: "+repr(backend))
+    return backend(desc)
+
+
+__all__ = ["Aligner", "PythonAligner", "NumpyAligner", "PrunedAligner", "get_aligner"]
@@ -0,0 +1,217 @@
+# age/archive.py
+#  pyAGE - A Python implementation of the Analog Genetic Encoding
+#  Copyright (C) 2010  Janosch Gräf
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+""" Read-only population archives for analysis.
+
+    An archive is laid out to be memory mapped:
+
+        MAGIC
+        header       length (4 bytes) and JSON: descriptor, generation,
+                     number of agents and chromosomes
+        fitness      float64 per agent
+        ids          int64 per agent (NO_ID for None)
+        agents       uint64 per agent+1, index of the first chromosome
+        chromosomes  uint64 per chromosome+1, offset of the first base
+        bases        all chromosomes, packed
+
+    The columns start at multiples of 8 bytes after the header and all
+    numbers are in native byte order. Opening an archive only reads the
+    header; columns are memoryviews of the mapping and chromosomes are
+    only copied and decoded when accessed. """
+
+import json
+import mmap
+import struct
+import sys
+from array import array
+from .genome import Genome
+from .population import Agent, Population
+from .checkpoint import _descriptor
+
+MAGIC = b"AGEARCH1"
+NO_ID = -(1<<63)
+
+
+def _pad(n):
+    return (8-n%8)%8
+
+def write_archive(f, population):
+    """ Writes 'population' as an archive to 'f' (a file name or a binary
+        file object). Agent ids must be integers or None. """
+    agents = population.agents
+    fitness = array("d", (a.fitness for a in agents))
+    ids = array("q")
+    for a in agents:
+        id = getattr(a, "id", None)
+        if (id!=None and type(id)!=int):
+            raise ValueError("Archive ids must be integers or None: "+repr(id))
+        ids.append(NO_ID if id==None else id)
+    first = array("Q", [0])
+    offsets = array("Q", [0])
+    bases = []
+    for a in agents:
+        for c in a.genome.chromosomes:
+            if (type(c)==str):
+                c = c.encode("utf-8")
+            bases.append(c)
+            offsets.append(offsets[-1]+len(c))
+        first.append(len(offsets)-1)
+    header = json.dumps({"descriptor": population.agedesc.get_params(),
+                         "generation": population.generation,
+                         "agents": len(agents),
+                         "chromosomes": len(offsets)-1,
+                         "byteorder": sys.byteorder}).encode("utf-8")
+    own = (type(f)==str)
+    if (own):
+        f = open(f, "wb")
+    try:
+        start = len(MAGIC)+4+len(header)
+        f.write(MAGIC+struct.pack("<I", len(header))+header+b"\0"*_pad(start))
+        for column in (fitness, ids, first, offsets):
+            f.write(column.tobytes())
+        for c in bases:
+            f.write(c)
+    finally:
+        if (own):
+            f.close()
+
+
+class AgentView(Agent):
+    """ Agent of an archive. Fitness and id are read from the columns, the
+        genome is built on first access. """
+
+    def __init__(self, archive, index):
+        self.archive = archive
+        self.index = index
+        self.agedesc = archive.desc
+
+    @property
+    def fitness(self):
+        return self.archive.fitness[self.index]
+
+    @property
+    def id(self):
+        id = self.archive.ids[self.index]
+        return None if id==NO_ID else id
+
+    @property
+    def parent(self):
+        # parents are not archived
+        return None
+
+    def get_chromosomes(self):
+        """ Returns the chromosomes in the encoding of the descriptor. """
+        archive = self.archive
+        return [archive.get_chromosome(i) for i in range(archive.first[self.index], archive.first[self.index+1])]
+
+    @property
+    def genome(self):
+        try:
+            return self.__dict__["genome"]
+        except KeyError:
+            genome = Genome(desc = self.agedesc, chromosomes = self.get_chromosomes(), trusted = True)
+            self.__dict__["genome"] = genome
+            return genome
+
+    def to_agent(self):
+        """ Returns a copy as a regular Agent. """
+        return Agent(self.agedesc, id = self.id, fitness = self.fitness, genome = self.genome)
+
+
+class PopulationArchive:
+    """ Memory mapped archive written by write_archive(). 'fitness' and
+        'ids' are columns indexable like lists, archive[k] returns an
+        AgentView. """
+
+    def __init__(self, f):
+        self.owned = (type(f)==str)
+        self.file = open(f, "rb") if self.owned else f
+        self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        if (self.map[:len(MAGIC)]!=MAGIC):
+            raise ValueError("Not a population archive")
+        n = struct.unpack_from("<I", self.map, len(MAGIC))[0]
+        start = len(MAGIC)+4
+        header = json.loads(self.map[start:start+n].decode("utf-8"))
+        if (header["byteorder"]!=sys.byteorder):
+            raise ValueError("Archive was written with a different byte order")
+        self.header = header
+        self.desc = _descriptor(header["descriptor"])
+        self.generation = header["generation"]
+        agents = header["agents"]
+        chromosomes = header["chromosomes"]
+        start += n+_pad(start+n)
+        view = memoryview(self.map)
+        columns = []
+        for format, length in (("d", agents), ("q", agents), ("Q", agents+1), ("Q", chromosomes+1)):
+            columns.append(view[start:start+8*length].cast(format))
+            start += 8*length
+        self.fitness, self.ids, self.first, self.offsets = columns
+        self.bases = view[start:]
+        self.views = columns+[self.bases, view]
+
+    def get_chromosome(self, i):
+        """ Returns chromosome 'i' of the archive (counting over all agents)
+            in the encoding of the descriptor. """
+        c = self.bases[self.offsets[i]:self.offsets[i+1]].tobytes()
+        return c if self.desc.encoding=="bytes" else c.decode("utf-8")
+
+    def __len__(self):
+        return len(self.fitness)
+
+    def __getitem__(self, k):
+        if (k<0):
+            k += len(self)
+        if (k<0 or k>=len(self)):
+            raise IndexError("Agent index out of range")
+        return AgentView(self, k)
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield AgentView(self, k)
+
+    def get_best(self):
+        k = max(range(len(self)), key = self.fitness.__getitem__)
+        return AgentView(self, k)
+
+    def to_population(self, **options):
+        """ Loads all agents into a Population; 'options' are passed to
+            Population (eval_callback defaults to None). """
+        options.setdefault("eval_callback", None)
+        population = Population(agedesc = self.desc, generation = self.generation, **options)
+        population.add(*[a.to_agent() for a in self])
+        return population
+
+    def close(self):
+        """ Unmaps the archive. AgentViews whose genome was not accessed yet
+            can not be used afterwards. """
+        if (self.map==None):
+            return
+        for v in self.views:
+            v.release()
+        self.map.close()
+        if (self.owned):
+            self.file.close()
+        self.map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+__all__ = ["AgentView", "PopulationArchive", "write_archive"]
@@ -0,0 +1,296 @@
+# age/bench.py
+#  pyAGE - A Python implementation of the Analog Genetic Encoding
+#  Copyright (C) 2010  Janosch Gräf
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+""" Benchmarks for pyAGE. Run with: python -m age.bench [--quick] [--json FILE]
+
+    Every benchmark builds its inputs from a fixed seed and returns a list
+    of results {"benchmark": name, "params": {...}, "seconds": time per
+    call}, so the JSON output of two runs (e.g. of two releases or two
+    alignment backends) can be compared entry by entry. """
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import tracemalloc
+from timeit import default_timer
+
+from .descriptor import Descriptor
+from .genome import Genome
+from .population import Agent, Population, roulette_wheel
+from .selection import RouletteWheel
+from .alignment import ALIGNERS, numpy
+from .checkpoint import save_checkpoint, CheckpointReader
+from .archive import write_archive, PopulationArchive
+
+
+def timed(func, repeat = 3, min_time = 0.2):
+    """ Returns the best time per call of 'func' in seconds. """
+    best = None
+    for r in range(repeat):
+        n = 0
+        t0 = default_timer()
+        while (True):
+            func()
+            n += 1
+            t = default_timer()-t0
+            if (t>=min_time):
+                break
+        if (best==None or t/n<best):
+            best = t/n
+    return best
+
+def random_sequence(alphabet, length):
+    return "".join((random.choice(alphabet) for i in range(length)))
+
+def make_descriptor(**params):
+    params.setdefault("alphabet", "ACGT")
+    params.setdefault("devices", ["ACGA", "ACGC"])
+    params.setdefault("terminal", "TGC")
+    params.setdefault("parameter", "TGA")
+    desc = Descriptor(**params)
+    assert desc.check()
+    return desc
+
+def make_chromosome(desc, length, density):
+    """ Returns a random chromosome with about 'density' devices per 1000
+        bases, each followed by two terminals and a parameter. """
+    parts = []
+    n = 0
+    while (n<length):
+        if (random.random()<density/1000.0*20):
+            part = random.choice(desc.devices)
+            for marker in (desc.terminal, desc.terminal, desc.parameter):
+                part += random_sequence(desc.alphabet, random.randrange(5, 15))+marker
+        else:
+            part = random_sequence(desc.alphabet, 20)
+        parts.append(part)
+        n += len(part)
+    return "".join(parts)[:length]
+
+def make_population(desc, size, length = 50):
+    population = Population(agedesc = desc, eval_callback = None)
+    for i in range(size):
+        genome = Genome(desc = desc, chromosomes = [random_sequence(desc.alphabet, length)], trusted = True)
+        population.add(Agent(desc, genome = genome, fitness = random.random()))
+    return population
+
+def result(name, seconds, **params):
+    return {"benchmark": name, "params": params, "seconds": seconds}
+
+
+def bench_alignment(lengths = (10, 20, 50, 100, 200, 500), seed = 0):
+    """ Times all available alignment backends on random terminals. """
+    desc = make_descriptor()
+    backends = [name for name in ALIGNERS if (name!="numpy" or numpy!=None)]
+    results = []
+    for length in lengths:
+        random.seed(seed)
+        a = random_sequence(desc.alphabet, length)
+        b = random_sequence(desc.alphabet, length)
+        for name in backends:
+            aligner = ALIGNERS[name](desc)
+            results.append(result("alignment", timed(lambda: aligner.align(a, b)), length = length, backend = name))
+    return results
+
+def bench_parse(lengths = (1000, 10000, 100000), densities = (1, 10, 50), seed = 0):
+    """ Times parsing a single chromosome from scratch. """
+    results = []
+    for encoding in ("str", "bytes"):
+        desc = make_descriptor(encoding = encoding)
+        for length in lengths:
+            for density in densities:
+                random.seed(seed)
+                genome = Genome(desc = desc, chromosomes = [make_chromosome(desc, length, density)])
+                def parse():
+                    genome.mark_dirty()
+                    genome.parse()
+                results.append(result("parse", timed(parse), length = length, density = density, encoding = encoding))
+    return results
+
+def bench_mutate(settings = (0.001, 0.01, 0.1), length = 5000, seed = 0):
+    """ Times mutating a genome of three chromosomes, with all mutation
+        possibilities set to each of 'settings'. """
+    results = []
+    names = ["char_delete", "char_insert", "char_replace", "frag_delete", "frag_move",
+             "frag_copy", "device_insert", "chromosome_delete", "chromosome_copy"]
+    for encoding in ("str", "bytes"):
+        for p in settings:
+            desc = make_descriptor(encoding = encoding, possibilities = dict(((n, p) for n in names)))
+            random.seed(seed)
+            chromosomes = [desc.encode(random_sequence(desc.alphabet, length)) for i in range(3)]
+            def mutate():
+                Genome(desc = desc, chromosomes = list(chromosomes), trusted = True).mutate()
+            results.append(result("mutate", timed(mutate), possibility = p, length = length, encoding = encoding))
+    return results
+
+def bench_crossover(lengths = (100, 1000, 10000), operators = ("one_point", "two_point", "homologous"), seed = 0):
+    """ Times the crossover of two genomes of three chromosomes, each pair
+        of which is crossed over. """
+    results = []
+    for operator in operators:
+        desc = make_descriptor(crossover = operator, possibilities = {"chromosome_crossover": 1.0})
+        for length in lengths:
+            random.seed(seed)
+            a = Genome(desc = desc, chromosomes = [make_chromosome(desc, length, 10) for i in range(3)])
+            b = Genome(desc = desc, chromosomes = [make_chromosome(desc, length, 10) for i in range(3)])
+            results.append(result("crossover", timed(lambda: a.crossover(b)), length = length, operator = operator))
+    return results
+
+def bench_selection(sizes = (100, 1000, 10000, 100000), seed = 0):
+    """ Times roulette_wheel (one call builds the wheel) and a whole
+        generation of parent pairs, and mate() on populations of small
+        genomes. """
+    desc = make_descriptor(elitism = 0.1)
+    results = []
+    for size in sizes:
+        random.seed(seed)
+        fitness = [random.random() for i in range(size)]
+        results.append(result("roulette_wheel", timed(lambda: roulette_wheel(fitness, 2)), size = size))
+        results.append(result("selection_pairs", timed(lambda: RouletteWheel(fitness).pairs(size), repeat = 1), size = size))
+        random.seed(seed)
+        population = make_population(desc, size)
+        results.append(result("mate", timed(population.mate, repeat = 1), size = size))
+    return results
+
+def bench_io(sizes = (1000, 10000), seed = 0):
+    """ Times save/load round-trips of checkpoints and archives. """
+    desc = make_descriptor()
+    results = []
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "bench")
+    try:
+        for size in sizes:
+            random.seed(seed)
+            population = make_population(desc, size, 500)
+            def checkpoint():
+                save_checkpoint(path, population)
+                with CheckpointReader(path) as reader:
+                    for a in reader:
+                        pass
+            def archive():
+                write_archive(path, population)
+                with PopulationArchive(path) as archive:
+                    max(archive.fitness)
+            results.append(result("checkpoint_roundtrip", timed(checkpoint, repeat = 1), size = size))
+            results.append(result("archive_roundtrip", timed(archive, repeat = 1), size = size))
+    finally:
+        if (os.path.exists(path)):
+            os.remove(path)
+        os.rmdir(directory)
+    return results
+
+def bench_memory(sizes = (10000, 100000), length = 200, density = 20, seed = 0):
+    """ Measures the memory per agent of populations of random agents, with
+        unparsed genomes and with all devices and parameters decoded. The
+        chromosomes are drawn from a pool built beforehand, so only the
+        overhead of agents, genomes and devices is counted. """
+    desc = make_descriptor()
+    random.seed(seed)
+    pool = [make_chromosome(desc, length, density) for i in range(1000)]
+    results = []
+    for size in sizes:
+        for parsed in (False, True):
+            tracemalloc.start()
+            t0 = default_timer()
+            population = Population(agedesc = desc, eval_callback = None)
+            for i in range(size):
+                genome = Genome(desc = desc, chromosomes = [pool[i%len(pool)]], trusted = True)
+                population.add(Agent(desc, genome = genome, fitness = 0.5))
+                if (parsed):
+                    for d in genome.devices:
+                        d.parameters
+            seconds = default_timer()-t0
+            used = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            r = result("memory", seconds, size = size, parsed = parsed)
+            r["bytes_per_agent"] = used/size
+            results.append(r)
+            del population
+    return results
+
+BENCHMARKS = {"alignment": bench_alignment,
+              "parse": bench_parse,
+              "mutate": bench_mutate,
+              "crossover": bench_crossover,
+              "selection": bench_selection,
+              "io": bench_io,
+              "memory": bench_memory}
+
+# smaller inputs for a quick run
+QUICK = {"alignment": {"lengths": (10, 100)},
+         "parse": {"lengths": (1000, 10000), "densities": (10,)},
+         "mutate": {"settings": (0.01,)},
+         "crossover": {"lengths": (1000,)},
+         "selection": {"sizes": (100, 1000)},
+         "io": {"sizes": (1000,)},
+         "memory": {"sizes": (1000,)}}
+
+
+def environment():
+    """ Returns information about the interpreter and the libraries. """
+    # imported here, since age/__init__ imports this module indirectly
+    import age
+    return {"python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "numpy": numpy.__version__ if numpy!=None else None,
+            "age": age.__version__,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def run(names = None, quick = False, seed = 0):
+    """ Runs the benchmarks 'names' (all by default) and returns the report
+        as a dictionary. """
+    results = []
+    for name in (names or BENCHMARKS):
+        options = dict(QUICK[name]) if quick else {}
+        results.extend(BENCHMARKS[name](seed = seed, **options))
+    return {"environment": environment(), "seed": seed, "quick": quick, "results": results}
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = "python -m age.bench", description = "pyAGE benchmarks")
+    parser.add_argument("benchmarks", nargs = "*", metavar = "BENCHMARK",
+                        help = "benchmarks to run: "+", ".join(BENCHMARKS)+" (default: all)")
+    parser.add_argument("--quick", action = "store_true", help = "use smaller inputs")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--json", metavar = "FILE", help = "write the results as JSON to FILE (- for stdout)")
+    args = parser.parse_args(argv)
+    for name in args.benchmarks:
+        if (name not in BENCHMARKS):
+            parser.error("unknown benchmark: "+name)
+    report = run(args.benchmarks, args.quick, args.seed)
+    if (args.json=="-"):
+        json.dump(report, sys.stdout, indent = 1)
+        print()
+        return
+    if (args.json!=None):
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent = 1)
+    for r in report["results"]:
+        params = ", ".join(("%s=%s"%(k, v) for k, v in sorted(r["params"].items())))
+        line = "%-22s %-45s %.6f s"%(r["benchmark"], params, r["seconds"])
+        if ("bytes_per_agent" in r):
+            line += "  %.0f bytes/agent"%(r["bytes_per_agent"],)
+        print(line)
+
+
+if (__name__=="__main__"):
+    main()
@@ -0,0 +1,94 @@
+# age/cache.py
+#  pyAGE - A Python implementation of the Analog Genetic Encoding
+#  Copyright (C) 2010  Janosch Gräf
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+from sys import getsizeof
+
+
+def sizeof(key, value):
+    """ Approximate memory used by a cache entry in bytes. """
+    size = getsizeof(key)+getsizeof(value)
+    if (type(key)==tuple):
+        size += sum((getsizeof(k) for k in key if type(k) in (str, bytes)))
+    return size
+
+
+class LRUCache:
+    """ Cache which discards the least recently used entries, once it holds
+        more than 'max_entries' entries or more than 'max_bytes' bytes (as
+        estimated by 'sizeof'). Either limit may be None. """
+
+    def __init__(self, max_entries = None, max_bytes = None, sizeof = sizeof):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default = None):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value[0]
+
+    def put(self, key, value):
+        size = self.sizeof(key, value) if self.max_bytes!=None else 0
+        old = self.entries.pop(key, None)
+        if (old!=None):
+            self.size -= old[1]
+        self.entries[key] = (value, size)
+        self.size += size
+        while (self.entries and ((self.max_entries!=None and len(self.entries)>self.max_entries) \
+                              or (self.max_bytes!=None and self.size>self.max_bytes))):
+            key, (value, size) = self.entries.popitem(last = False)
+            self.size -= size
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def hit_rate(self):
+        n = self.hits+self.misses
+        return self.hits/n if n>0 else 0.0
+
+    def stats(self):
+        return {"entries": len(self.entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hit_rate()}
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return "LRUCache(max_entries = "+repr(self.max_entries)+", max_bytes = "+repr(self.max_bytes)+")"
+
+
+__all__ = ["LRUCache"]
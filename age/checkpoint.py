@@ -0,0 +1,299 @@
+# age/checkpoint.py
+#  pyAGE - A Python implementation of the Analog Genetic Encoding
+#  Copyright (C) 2010  Janosch Gräf
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+""" Streaming population checkpoints.
+
+    A checkpoint file consists of
+
+        MAGIC
+        header    JSON: version, descriptor, generation, compression
+        chunks    each the (compressed) concatenation of up to 'chunksize'
+                  agent records
+        index     JSON: list of [offset, number of agents] of every chunk
+        footer    offset of the index (8 bytes), MAGIC
+
+    Header, chunks and index are blocks: a tag byte (b"H", b"C", b"I"),
+    the length of the data (4 bytes) and the data. An agent record is its
+    id (JSON), its fitness (float64) and its chromosomes, each length
+    prefixed. All integers are little endian.
+    Agents can be read one after another without the index, or single
+    agents by their number with it. """
+
+import json
+import struct
+import bisect
+import zlib
+import bz2
+import lzma
+from .descriptor import Descriptor
+from .genome import Genome
+from .population import Agent
+
+MAGIC = b"AGECKPT1"
+VERSION = 1
+
+# compress(data, level), decompress(data) and the default level; zlib
+# defaults to its fastest level, since checkpoints are written while evolving
+COMPRESSIONS = {None: (lambda data, level: data, lambda data: data, None),
+                "zlib": (zlib.compress, zlib.decompress, 1),
+                "bz2": (bz2.compress, bz2.decompress, 9),
+                "lzma": (lambda data, level: lzma.compress(data, preset = level), lzma.decompress, 6)}
+
+_length = struct.Struct("<I")
+_block = struct.Struct("<cI")
+_fitness = struct.Struct("<dI")
+_footer = struct.Struct("<Q")
+
+
+def _open(f, mode):
+    """ Returns a file object and whether it has to be closed. """
+    if (type(f)==str):
+        return open(f, mode), True
+    return f, False
+
+def _read_block(f, tag = None):
+    """ Returns the tag and the data of the next block. """
+    data = f.read(_block.size)
+    if (len(data)<_block.size):
+        raise EOFError("Truncated checkpoint")
+    t, n = _block.unpack(data)
+    if (tag!=None and t!=tag):
+        raise ValueError("Expected block "+repr(tag)+", found "+repr(t))
+    data = f.read(n)
+    if (len(data)<n):
+        raise EOFError("Truncated checkpoint")
+    return t, data
+
+def _descriptor(params):
+    if (params.get("scoring")!=None):
+        params["scoring"] = tuple((tuple(l) for l in params["scoring"]))
+    return Descriptor(**params)
+
+
+class CheckpointWriter:
+    """ Writes agents to a checkpoint as they are passed to write(). Only
+        the current chunk is kept in memory. 'f' is a file name or a binary
+        file object; 'level' is the compression level, None for the default
+        of 'compression'. """
+
+    def __init__(self, f, desc, generation = 0, compression = "zlib", chunksize = 256, level = None):
+        if (compression not in COMPRESSIONS):
+            raise ValueError("Unknown compression: "+repr(compression))
+        self.desc = desc
+        self.compression = COMPRESSIONS[compression]
+        self.level = level if level!=None else self.compression[2]
+        self.chunksize = chunksize
+        self.f, self.owned = _open(f, "wb")
+        self.offset = 0
+        self.index = []
+        self.records = []
+        header = {"version": VERSION,
+                  "descriptor": desc.get_params(),
+                  "generation": generation,
+                  "compression": compression,
+                  "chunksize": chunksize}
+        self.write_raw(MAGIC)
+        self.write_block(b"H", json.dumps(header).encode("utf-8"))
+
+    def write_raw(self, data):
+        self.f.write(data)
+        self.offset += len(data)
+
+    def write_block(self, tag, data):
+        self.write_raw(_block.pack(tag, len(data)))
+        self.write_raw(data)
+
+    def write(self, agent):
+        """ Appends 'agent' to the checkpoint. """
+        record = [json.dumps(getattr(agent, "id", None)).encode("utf-8")]
+        chromosomes = agent.genome.chromosomes
+        record.append(_fitness.pack(agent.fitness, len(chromosomes)))
+        for c in chromosomes:
+            if (type(c)==str):
+                c = c.encode("utf-8")
+            record.append(_length.pack(len(c)))
+            record.append(c)
+        self.records.append(_length.pack(len(record[0]))+b"".join(record))
+        if (len(self.records)>=self.chunksize):
+            self.flush()
+
+    def write_all(self, agents):
+        for a in agents:
+            self.write(a)
+
+    def flush(self):
+        """ Writes the pending records as a chunk. """
+        if (len(self.records)==0):
+            return
+        self.index.append((self.offset, len(self.records)))
+        self.write_block(b"C", self.compression[0](b"".join(self.records), self.level))
+        self.records = []
+
+    def close(self):
+        """ Writes the last chunk and the index. """
+        if (self.f==None):
+            return
+        self.flush()
+        offset = self.offset
+        self.write_block(b"I", json.dumps(self.index).encode("utf-8"))
+        self.write_raw(_footer.pack(offset))
+        self.write_raw(MAGIC)
+        if (self.owned):
+            self.f.close()
+        else:
+            self.f.flush()
+        self.f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CheckpointReader:
+    """ Reads a checkpoint written by CheckpointWriter. Iterating yields the
+        agents one by one without reading the whole file; reader[k] loads
+        agent k using the index, which requires a seekable file. """
+
+    def __init__(self, f):
+        self.f, self.owned = _open(f, "rb")
+        if (self.f.read(len(MAGIC))!=MAGIC):
+            raise ValueError("Not a checkpoint")
+        header = json.loads(_read_block(self.f, b"H")[1].decode("utf-8"))
+        if (header["version"]!=VERSION):
+            raise ValueError("Unsupported checkpoint version: "+repr(header["version"]))
+        self.header = header
+        self.desc = _descriptor(header["descriptor"])
+        if (not self.desc.check()):
+            raise ValueError("Invalid descriptor in checkpoint")
+        self.generation = header["generation"]
+        self.decompress = COMPRESSIONS[header["compression"]][1]
+        self.start = self.f.tell()
+        self.index = None
+        self.cache = (None, None)
+
+    def get_index(self):
+        """ Returns the list of (offset, number of agents) of all chunks. """
+        if (self.index==None):
+            f = self.f
+            f.seek(-(_footer.size+len(MAGIC)), 2)
+            offset = _footer.unpack(f.read(_footer.size))[0]
+            if (f.read(len(MAGIC))!=MAGIC):
+                raise EOFError("Truncated checkpoint")
+            f.seek(offset)
+            self.index = [tuple(e) for e in json.loads(_read_block(f, b"I")[1].decode("utf-8"))]
+            # number of the first agent of every chunk
+            self.first = [0]
+            for offset, n in self.index:
+                self.first.append(self.first[-1]+n)
+        return self.index
+
+    def parse_chunk(self, data):
+        """ Returns the agents of a chunk. """
+        data = self.decompress(data)
+        agents = []
+        desc = self.desc
+        bytes_encoding = (desc.encoding=="bytes")
+        unpack_length = _length.unpack_from
+        p = 0
+        while (p<len(data)):
+            n = unpack_length(data, p)[0]
+            p += _length.size
+            id = json.loads(data[p:p+n].decode("utf-8"))
+            p += n
+            fitness, count = _fitness.unpack_from(data, p)
+            p += _fitness.size
+            chromosomes = []
+            for i in range(count):
+                n = unpack_length(data, p)[0]
+                p += _length.size
+                c = data[p:p+n]
+                chromosomes.append(c if bytes_encoding else c.decode("utf-8"))
+                p += n
+            genome = Genome(desc = desc, chromosomes = chromosomes, trusted = True)
+            agents.append(Agent(desc, id = id, fitness = fitness, genome = genome))
+        return agents
+
+    def chunk(self, k):
+        if (self.cache[0]!=k):
+            self.f.seek(self.get_index()[k][0])
+            self.cache = (k, self.parse_chunk(_read_block(self.f, b"C")[1]))
+        return self.cache[1]
+
+    def agents(self, start = 0):
+        """ Generator of the agents, beginning with agent 'start'. """
+        if (start>0):
+            self.get_index()
+            k = bisect.bisect_right(self.first, start)-1
+            for c in range(k, len(self.index)):
+                for a in self.chunk(c)[start-self.first[c] if c==k else 0:]:
+                    yield a
+            return
+        # the file is shared with reader[k], so the position is restored
+        # before every read
+        offset = self.start
+        while (True):
+            self.f.seek(offset)
+            tag, data = _read_block(self.f)
+            offset = self.f.tell()
+            if (tag!=b"C"):
+                # the index follows the last chunk
+                return
+            for a in self.parse_chunk(data):
+                yield a
+
+    def __iter__(self):
+        return self.agents()
+
+    def __len__(self):
+        self.get_index()
+        return self.first[-1]
+
+    def __getitem__(self, k):
+        if (k<0):
+            k += len(self)
+        if (k<0 or k>=len(self)):
+            raise IndexError("Agent index out of range")
+        c = bisect.bisect_right(self.first, k)-1
+        return self.chunk(c)[k-self.first[c]]
+
+    def close(self):
+        if (self.owned and self.f!=None):
+            self.f.close()
+        self.f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def save_checkpoint(f, population, **options):
+    """ Writes 'population' to the checkpoint 'f'. """
+    with CheckpointWriter(f, population.agedesc, population.generation, **options) as writer:
+        writer.write_all(population.agents)
+
+def iter_checkpoint(f):
+    """ Generator of the agents in the checkpoint 'f'. """
+    with CheckpointReader(f) as reader:
+        for a in reader:
+            yield a
+
+
+__all__ = ["CheckpointWriter", "CheckpointReader", "save_checkpoint", "iter_checkpoint"]
@@ -0,0 +1,122 @@
+# age/come.py
+#  pyAGE - A Python implementation of the Analog Genetic Encoding
+#  Copyright (C) 2010  Janosch Gräf
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class CoME:
+    """ Center of Mass Encoding of parameters.
+
+        A parameter p of length n with alphabet size beta decodes to
+
+            sum(index(p[i])*w[i]) / ((beta-1)*sum(w[i])),  w[i] = (beta*alpha)^-i
+
+        The weights and normalisations only depend on the descriptor, so
+        they are kept in tables, which grow to the longest parameter seen. """
+
+    # below this number of parameters, decode_many() does not use numpy
+    min_batch = 64
+
+    def __init__(self, desc, alpha = None):
+        self.desc = desc
+        self.alpha = desc.come_alpha if alpha==None else alpha
+        self.beta = float(len(desc.alphabet))
+        self.digits = dict(((c, i) for i, c in enumerate(desc.alphabet)))
+        self.weights = []
+        # norms[n] = (beta-1)*(w[0]+...+w[n-1]); sums in the same order as
+        # the original decoder, so the values are identical
+        self.sums = [0]
+        self.norms = [0.0]
+
+    def grow(self, length):
+        """ Extends the tables to parameters of 'length' bases. """
+        base = self.beta*self.alpha
+        for i in range(len(self.weights), length):
+            self.weights.append(pow(base, -i))
+            self.sums.append(self.sums[-1]+self.weights[-1])
+            self.norms.append((self.beta-1)*self.sums[-1])
+
+    def indices(self, parameter):
+        if (type(parameter)==bytes):
+            return parameter
+        digits = self.digits
+        return [digits.get(c, -1) for c in parameter]
+
+    def decode(self, parameter):
+        """ Returns the value of 'parameter' in [0, 1]. """
+        n = len(parameter)
+        if (n>=len(self.norms)):
+            self.grow(n)
+        digits = self.indices(parameter)
+        weights = self.weights
+        return sum((digits[i]*weights[i] for i in range(n)))/self.norms[n]
+
+    def decode_many(self, parameters):
+        """ Returns the values of a list of parameters. """
+        if (numpy==None or len(parameters)<self.min_batch):
+            return [self.decode(p) for p in parameters]
+        lengths = numpy.array([len(p) for p in parameters])
+        n = lengths.max()
+        if (n>=len(self.norms)):
+            self.grow(n)
+        digits = None
+        if (type(parameters[0])==bytes):
+            digits = numpy.frombuffer(b"".join(parameters), dtype = numpy.uint8)
+        elif (len(self.desc.alphabet)<=256):
+            # translate all parameters at once
+            try:
+                joined = "".join(parameters).translate(self.desc.get_codec()[0]).encode("latin-1")
+                digits = numpy.frombuffer(joined, dtype = numpy.uint8)
+                if (digits.max()>=len(self.desc.alphabet)):
+                    digits = None
+            except UnicodeEncodeError:
+                pass
+        if (digits is None):
+            digits = numpy.array([d for p in parameters for d in self.indices(p)], dtype = numpy.intp)
+        # place the weighted digits into a padded matrix, one row per
+        # parameter, and sum each row from left to right like decode()
+        rows = numpy.repeat(numpy.arange(len(parameters)), lengths)
+        starts = numpy.cumsum(lengths)-lengths
+        cols = numpy.arange(len(digits))-numpy.repeat(starts, lengths)
+        weighted = numpy.zeros((len(parameters), n))
+        weighted[rows, cols] = digits*numpy.array(self.weights)[cols]
+        sums = numpy.add.accumulate(weighted, axis = 1)[numpy.arange(len(parameters)), numpy.maximum(lengths-1, 0)]
+        return (sums/numpy.array(self.norms)[lengths]).tolist()
+
+    def encode(self, value, length):
+        """ Returns a parameter of 'length' bases (in the chromosome encoding
+            of the descriptor) which decodes to approximately 'value'. The
+            digits are chosen greedily from the largest weight down, so the
+            error is in the order of the smallest weight over the norm. """
+        if (length>=len(self.norms)):
+            self.grow(length)
+        beta = int(self.beta)
+        rest = min(max(value, 0.0), 1.0)*self.norms[length]
+        order = sorted(range(length), key = lambda i: -self.weights[i])
+        digits = [0]*length
+        for k, i in enumerate(order):
+            d = rest/self.weights[i]
+            d = int(d+0.5) if k==length-1 else int(d)
+            digits[i] = min(beta-1, max(0, d))
+            rest -= digits[i]*self.weights[i]
+        return self.desc.encode("".join((self.desc.alphabet[d] for d in digits)))
+
+
+__all__ = ["CoME"]
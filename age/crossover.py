@@ -0,0 +1,169 @@
+# age/crossover.py
+#  pyAGE - A Python implementation of the Analog Genetic Encoding
+#  Copyright (C) 2010  Janosch Gräf
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+""" Crossover of two chromosomes.
+
+    An operator chooses cut points [(i1, j1), (i2, j2), ...], with
+    increasing positions i in chromosome a and j in chromosome b. The first
+    child consists of a[:i1], b[j1:j2], a[i2:i3], ..., the second one of
+    the complementary parts b[:j1], a[i1:i2], b[j2:j3], .... Parts of bytes
+    chromosomes are joined from memoryviews, so only the child is built.
+    str chromosomes have no views; their parts are sliced (copied) before
+    they are joined, so the "bytes" encoding is cheaper for long
+    chromosomes. A child which is a whole parent is that parent, so its
+    devices can be reused, and an empty child is replaced by the first
+    parent. """
+
+import random
+
+
+class Crossover:
+    """ Base class of the crossover operators. An operator is created per
+        descriptor and implements cuts(a, b, rng). """
+
+    name = None
+
+    def __init__(self, desc):
+        self.desc = desc
+
+    def cuts(self, a, b, rng = random):
+        raise NotImplementedError()
+
+    def splice(self, a, b, cuts, swap = False):
+        """ Returns the first child of 'a' and 'b' cut at 'cuts', or the
+            second if 'swap' is set. """
+        pa = [0]+[c[0] for c in cuts]+[len(a)]
+        pb = [0]+[c[1] for c in cuts]+[len(b)]
+        parts = []
+        for k in range(len(pa)-1):
+            if ((k%2==0)!=swap):
+                c, start, end = a, pa[k], pa[k+1]
+            else:
+                c, start, end = b, pb[k], pb[k+1]
+            if (end>start):
+                parts.append((c, start, end))
+        if (len(parts)==0):
+            return a
+        if (len(parts)==1 and parts[0][1]==0 and parts[0][2]==len(parts[0][0])):
+            return parts[0][0]
+        if (type(a)==bytes):
+            return b"".join([memoryview(c)[start:end] for c, start, end in parts])
+        return "".join([c[start:end] for c, start, end in parts])
+
+    def child(self, a, b, rng = random):
+        """ Returns the first child of 'a' and 'b'. """
+        return self.splice(a, b, self.cuts(a, b, rng))
+
+    def children(self, a, b, rng = random):
+        """ Returns both children of 'a' and 'b'. """
+        cuts = self.cuts(a, b, rng)
+        return self.splice(a, b, cuts), self.splice(a, b, cuts, True)
+
+
+class OnePointCrossover(Crossover):
+    """ Cuts both chromosomes at a random position each. """
+
+    name = "one_point"
+
+    def cuts(self, a, b, rng = random):
+        return [(int(rng.random()*len(a)), int(rng.random()*len(b)))]
+
+
+class TwoPointCrossover(Crossover):
+    """ Exchanges a random part of a with a random part of b. """
+
+    name = "two_point"
+
+    def cuts(self, a, b, rng = random):
+        i = sorted((int(rng.random()*(len(a)+1)) for k in range(2)))
+        j = sorted((int(rng.random()*(len(b)+1)) for k in range(2)))
+        return [(i[0], j[0]), (i[1], j[1])]
+
+
+class HomologousCrossover(Crossover):
+    """ Cuts both chromosomes in front of homologous devices. The device
+        sequences of both chromosomes are aligned (longest common
+        subsequence of the device names, in O(len(da)*len(db))), and the
+        chromosomes are cut in front of a random pair of aligned devices,
+        so the child keeps the order of the devices. Chromosomes without a
+        common device are crossed over at one random point. """
+
+    name = "homologous"
+
+    def __init__(self, desc):
+        Crossover.__init__(self, desc)
+        self.fallback = OnePointCrossover(desc)
+
+    def homologous(self, a, b):
+        """ Returns the pairs of positions of aligned devices of 'a' and
+            'b'. """
+        tokenizer = self.desc.get_tokenizer()
+        da = tokenizer.markers(a)
+        db = tokenizer.markers(b)
+        n, m = len(da), len(db)
+        if (n==0 or m==0):
+            return []
+        # L[i][j] is the length of the longest common subsequence of the
+        # device names da[i:] and db[j:]
+        L = [[0]*(m+1) for i in range(n+1)]
+        for i in range(n-1, -1, -1):
+            x = da[i][1]
+            row, below = L[i], L[i+1]
+            for j in range(m-1, -1, -1):
+                if (x==db[j][1]):
+                    row[j] = below[j+1]+1
+                else:
+                    row[j] = max(below[j], row[j+1])
+        pairs = []
+        i = j = 0
+        while (i<n and j<m):
+            if (da[i][1]==db[j][1]):
+                pairs.append((da[i][0], db[j][0]))
+                i += 1
+                j += 1
+            elif (L[i+1][j]>=L[i][j+1]):
+                i += 1
+            else:
+                j += 1
+        return pairs
+
+    def cuts(self, a, b, rng = random):
+        pairs = self.homologous(a, b)
+        if (len(pairs)==0):
+            return self.fallback.cuts(a, b, rng)
+        return [pairs[int(rng.random()*len(pairs))]]
+
+
+CROSSOVERS = {"one_point": OnePointCrossover,
+              "two_point": TwoPointCrossover,
+              "homologous": HomologousCrossover}
+
+def get_crossover(desc, method = None):
+    """ Create the crossover operator 'method' (a name from CROSSOVERS or a
+        Crossover subclass) for descriptor 'desc'; None is one-point
+        crossover. """
+    if (method==None):
+        method = "one_point"
+    if (type(method)==str):
+        try:
+            method = CROSSOVERS[method]
+        except KeyError:
+            raise ValueError("Unknown crossover operator: "+repr(method))
+    return method(desc)
+
+
+__all__ = ["Crossover", "OnePointCrossover", "TwoPointCrossover", "HomologousCrossover", "get_crossover"]
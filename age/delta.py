@@ -0,0 +1,314 @@
+# age/delta.py
+#  pyAGE - A Python implementation of the Analog Genetic Encoding
+#  Copyright (C) 2010  Janosch Gräf
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+""" Delta checkpoints: a population is written once in full (a snapshot)
+    and then once per generation as the difference to the previously
+    written generation.
+
+    The file starts with MAGIC and a header block, followed by one block
+    per written generation (see age.checkpoint for the block layout). A
+    snapshot (b"S") lists all agents, a delta (b"D") lists
+
+        removed    ids of the agents which are gone
+        agents     new agents and agents whose genome changed
+        fitness    new fitness values of the other agents
+        order      ids of all agents in population order
+
+    as zlib compressed JSON. An agent is [id, parent, fitness,
+    chromosomes]. A chromosome is either a string of the alphabet or
+    [id, k, edits]: chromosome k of agent 'id' of the previous generation
+    with edits [start, end, replacement] applied from left to right
+    (positions refer to the original chromosome). Unchanged chromosomes
+    are found wherever they were in the previous generation, changed ones
+    are encoded against the same chromosome of the agent itself if it
+    survived, otherwise of its parent. """
+
+import json
+import zlib
+import struct
+from difflib import SequenceMatcher
+from .genome import Genome
+from .population import Agent, Population
+from .checkpoint import _descriptor, _read_block
+
+MAGIC = b"AGEDELT1"
+VERSION = 1
+
+_block = struct.Struct("<cI")
+
+# middle parts of a changed chromosome shorter than this are replaced as a
+# whole instead of being matched
+MATCH_LENGTH = 64
+
+
+def common(a, b, n, part):
+    """ Returns the largest k<='n' with part(a, k)==part(b, k), by bisection,
+        so that the strings are compared in C. """
+    lo, hi = 0, n
+    while (lo<hi):
+        k = (lo+hi+1)//2
+        if (part(a, k)==part(b, k)):
+            lo = k
+        else:
+            hi = k-1
+    return lo
+
+def diff(a, b):
+    """ Returns edits [start, end, replacement] which turn 'a' into 'b'.
+        Common prefix and suffix are cut off first, so the usual small
+        mutations are found without matching the whole chromosome. """
+    n = min(len(a), len(b))
+    p = common(a, b, n, lambda x, k: x[:k])
+    s = common(a, b, n-p, lambda x, k: x[len(x)-k:])
+    a_mid = a[p:len(a)-s]
+    b_mid = b[p:len(b)-s]
+    if (len(a_mid)==0 and len(b_mid)==0):
+        return []
+    if (len(a_mid)<MATCH_LENGTH or len(b_mid)<MATCH_LENGTH):
+        return [[p, len(a)-s, b_mid]]
+    edits = []
+    for op, i1, i2, j1, j2 in SequenceMatcher(None, a_mid, b_mid, autojunk = False).get_opcodes():
+        if (op!="equal"):
+            edits.append([p+i1, p+i2, b_mid[j1:j2]])
+    return edits
+
+def patch(a, edits):
+    """ Applies edits returned by diff() to 'a'. """
+    parts = []
+    last = 0
+    for start, end, replacement in edits:
+        parts.append(a[last:start])
+        parts.append(replacement)
+        last = end
+    parts.append(a[last:])
+    return "".join(parts)
+
+
+class DeltaWriter:
+    """ Writes generations of a population to a delta checkpoint. The first
+        generation and every 'snapshot_every'-th after it (if not None) are
+        written in full, so replaying never needs more than that many
+        deltas. Agents need ids (see Population.add). """
+
+    def __init__(self, f, desc, snapshot_every = None, level = 1):
+        self.desc = desc
+        self.snapshot_every = snapshot_every
+        self.level = level
+        self.owned = (type(f)==str)
+        self.f = open(f, "wb") if self.owned else f
+        self.previous = None
+        self.written = 0
+        self.f.write(MAGIC)
+        header = {"version": VERSION, "descriptor": desc.get_params()}
+        self.write_block(b"H", json.dumps(header).encode("utf-8"))
+
+    def write_block(self, tag, data):
+        self.f.write(_block.pack(tag, len(data)))
+        self.f.write(data)
+
+    def encode_agent(self, agent, base = None, known = None):
+        """ Returns the record of 'agent'. Chromosomes in 'known' (mapping
+            chromosomes to (id, k)) are referenced, others are encoded
+            against the chromosomes of 'base', an (id, chromosomes) tuple,
+            if given. """
+        text = self.desc.decode
+        encoded = []
+        for i, c in enumerate(agent.genome.chromosomes):
+            ref = known.get(c) if known!=None else None
+            if (ref!=None):
+                encoded.append([ref[0], ref[1], []])
+            elif (base!=None and i<len(base[1])):
+                edits = diff(text(base[1][i]), text(c))
+                if (sum((len(e[2])+8 for e in edits))<len(c)):
+                    encoded.append([base[0], i, edits])
+                else:
+                    encoded.append(text(c))
+            else:
+                encoded.append(text(c))
+        return [agent.id, agent.parent, agent.fitness, encoded]
+
+    def write(self, population):
+        """ Writes the current generation of 'population'. """
+        current = {}
+        for a in population.agents:
+            if (a.id==None):
+                raise ValueError("Agents of a delta checkpoint need ids")
+            current[a.id] = (a.fitness, tuple(a.genome.chromosomes))
+        previous = self.previous
+        snapshot = previous==None or (self.snapshot_every!=None and self.written%self.snapshot_every==0)
+        if (snapshot):
+            record = {"generation": population.generation,
+                      "agents": [self.encode_agent(a, None) for a in population.agents]}
+        else:
+            known = {}
+            for id, (f, chromosomes) in previous.items():
+                for k, c in enumerate(chromosomes):
+                    known.setdefault(c, (id, k))
+            agents = []
+            fitness = []
+            for a in population.agents:
+                old = previous.get(a.id)
+                if (old!=None and old[1]==current[a.id][1]):
+                    if (old[0]!=a.fitness):
+                        fitness.append([a.id, a.fitness])
+                    continue
+                if (old!=None):
+                    base = (a.id, old[1])
+                elif (a.parent in previous):
+                    base = (a.parent, previous[a.parent][1])
+                else:
+                    base = None
+                agents.append(self.encode_agent(a, base, known))
+            record = {"generation": population.generation,
+                      "removed": [id for id in previous if id not in current],
+                      "agents": agents,
+                      "fitness": fitness,
+                      "order": [a.id for a in population.agents]}
+        data = zlib.compress(json.dumps(record).encode("utf-8"), self.level)
+        self.write_block(b"S" if snapshot else b"D", data)
+        self.f.flush()
+        self.previous = current
+        self.written += 1
+
+    def close(self):
+        if (self.f!=None and self.owned):
+            self.f.close()
+        self.f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DeltaReader:
+    """ Reads a delta checkpoint. The blocks are located when opening the
+        file, but only read when a generation is replayed. """
+
+    def __init__(self, f):
+        self.owned = (type(f)==str)
+        self.f = open(f, "rb") if self.owned else f
+        if (self.f.read(len(MAGIC))!=MAGIC):
+            raise ValueError("Not a delta checkpoint")
+        header = json.loads(_read_block(self.f, b"H")[1].decode("utf-8"))
+        if (header["version"]!=VERSION):
+            raise ValueError("Unsupported delta checkpoint version: "+repr(header["version"]))
+        self.desc = _descriptor(header["descriptor"])
+        if (not self.desc.check()):
+            raise ValueError("Invalid descriptor in delta checkpoint")
+        # (tag, offset of the data, length) of every written generation
+        self.blocks = []
+        while (True):
+            data = self.f.read(_block.size)
+            if (len(data)<_block.size):
+                break
+            tag, n = _block.unpack(data)
+            offset = self.f.tell()
+            if (self.f.seek(0, 2)<offset+n):
+                # generation not written completely
+                break
+            self.blocks.append((tag, offset, n))
+            self.f.seek(offset+n)
+
+    def __len__(self):
+        """ Number of written generations. """
+        return len(self.blocks)
+
+    def record(self, k):
+        tag, offset, n = self.blocks[k]
+        self.f.seek(offset)
+        return tag, json.loads(zlib.decompress(self.f.read(n)).decode("utf-8"))
+
+    def decode_agent(self, entry, state):
+        """ Returns (fitness, chromosomes, parent) of an agent record, with
+            references into 'state', the previous generation. """
+        id, parent, fitness, chromosomes = entry
+        desc = self.desc
+        decoded = []
+        for c in chromosomes:
+            if (type(c)==str):
+                decoded.append(desc.encode(c))
+            else:
+                ref, k, edits = c
+                c = state[ref][1][k]
+                if (len(edits)>0):
+                    c = desc.encode(patch(desc.decode(c), edits))
+                decoded.append(c)
+        return (fitness, decoded, parent)
+
+    def replay(self, k):
+        """ Returns the state of written generation 'k' as generation number
+            and a list of (id, fitness, chromosomes, parent). """
+        if (k<0):
+            k += len(self.blocks)
+        start = k
+        while (self.blocks[start][0]!=b"S"):
+            start -= 1
+        state = {}
+        order = []
+        generation = None
+        for j in range(start, k+1):
+            tag, record = self.record(j)
+            generation = record["generation"]
+            if (tag==b"S"):
+                state = {}
+                for entry in record["agents"]:
+                    state[entry[0]] = self.decode_agent(entry, state)
+                order = [entry[0] for entry in record["agents"]]
+                continue
+            new = dict(state)
+            for id in record["removed"]:
+                del new[id]
+            for entry in record["agents"]:
+                # bases refer to the previous generation
+                new[entry[0]] = self.decode_agent(entry, state)
+            for id, fitness in record["fitness"]:
+                f, chromosomes, parent = new[id]
+                new[id] = (fitness, chromosomes, parent)
+            state = new
+            order = record["order"]
+        return generation, [(id,)+state[id] for id in order]
+
+    def population(self, k, **options):
+        """ Returns written generation 'k' as a Population; 'options' are
+            passed to Population (eval_callback defaults to None). """
+        generation, agents = self.replay(k)
+        options.setdefault("eval_callback", None)
+        population = Population(agedesc = self.desc, generation = generation, **options)
+        for id, fitness, chromosomes, parent in agents:
+            genome = Genome(desc = self.desc, chromosomes = list(chromosomes), trusted = True)
+            population.add(Agent(self.desc, id = id, parent = parent, fitness = fitness, genome = genome))
+        return population
+
+    def generations(self):
+        """ Returns the generation numbers of all written generations. """
+        return [self.record(k)[1]["generation"] for k in range(len(self.blocks))]
+
+    def close(self):
+        if (self.f!=None and self.owned):
+            self.f.close()
+        self.f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+__all__ = ["DeltaWriter", "DeltaReader"]
@@ -15,8 +15,32 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+from .alignment import get_aligner, PrunedAligner
+from .cache import LRUCache
+from .tokenizer import Tokenizer
+from .mutation import Mutator
+from .come import CoME
+from .crossover import get_crossover, CROSSOVERS
+from hashlib import blake2b
+import re
+from weakref import WeakValueDictionary
+
 
 class Descriptor:
+    # whether aligner and parser time their work, set by age.stats.Stats;
+    # not a setting, so it is not pickled
+    _timed = False
+
+    # settings hashed by fingerprint()
+    fingerprinted = ("alphabet", "devices", "terminal", "parameter", "scoring",
+                     "come_alpha", "encoding", "pruning")
+
+    def __setattr__(self, name, value):
+        # a changed setting changes the fingerprint
+        if (name in Descriptor.fingerprinted):
+            self.__dict__.pop("_fingerprint", None)
+        object.__setattr__(self, name, value)
+
     def __init__(self, **params):
         self.alphabet = params.get("alphabet", None)
         self.devices = params.get("devices", None)
@@ -26,6 +50,20 @@ class Descriptor:
         self.scoring = params.get("scoring", None)
         # TODO rename scoring matrix in substitution/insert/delete matrix
         self.come_alpha = params.get("come_alpha", 1.0)
+        # name of the alignment backend (see age.alignment), None for fastest
+        self.alignment = params.get("alignment", None)
+        # maximum number of cached alignment scores, or a shared LRUCache
+        self.alignment_cache = params.get("alignment_cache", None)
+        # approximate terminal scoring: dictionary of the options band,
+        # threshold and seed of age.alignment.PrunedAligner, None for exact
+        self.pruning = params.get("pruning", None)
+        # share equal chromosomes and their devices between genomes
+        self.intern = params.get("intern", False)
+        # chromosome storage: "str" or "bytes" (alphabet indices)
+        self.encoding = params.get("encoding", "str")
+        # name of the crossover operator (see age.crossover), None for one
+        # point; applied with possibility "chromosome_crossover"
+        self.crossover = params.get("crossover", None)
         # used in populations
         self.elitism = params.get("elitism", 0.2)
 
@@ -53,6 +91,13 @@ class Descriptor:
                 return False
         return True
 
+    def check_chromosome(self, chromosome):
+        """ Checks a chromosome in the encoding of this descriptor. """
+        if (self.encoding=="bytes"):
+            return type(chromosome)==bytes and len(chromosome)>0 \
+               and len(chromosome.translate(None, bytes(range(len(self.alphabet)))))==0
+        return self.check_token(chromosome)
+
     def check_possibilities(self):
         keys = ["char_delete", "char_insert", "char_replace", "frag_delete", "frag_move", "frag_copy", "device_insert", "chromosome_delete", "chromosome_copy", "chromosome_crossover"]
         if (self.possibilities==None):
@@ -72,15 +117,18 @@ class Descriptor:
     def check_scoring(self):
         if (self.scoring==None):
             return True
+        # substitution matrix, optionally with an additional row/column for
+        # insertions/deletions
         b = len(self.alphabet)
-        if (type(self.scoring)!=tuple or len(self.scoring)!=b):
+        if (type(self.scoring)!=tuple or len(self.scoring) not in (b, b+1)):
             return False
         for l in self.scoring:
-            if (type(l)!=tuple or len(l)!=b):
+            if (type(l)!=tuple or len(l)!=len(self.scoring)):
                 return False
             for s in l:
                 if (type(s)!=float):
                     return False
+        return True
 
     def check_come_alpha(self):
         if (type(self.come_alpha)!=float):
@@ -90,6 +138,31 @@ class Descriptor:
                 return False
         return (self.come_alpha>=0.0 and self.come_alpha<=1.0)
 
+    def check_encoding(self):
+        if (self.encoding=="bytes"):
+            return len(self.alphabet)<=256
+        return self.encoding=="str"
+
+    def check_pruning(self):
+        if (self.pruning==None):
+            return True
+        if (type(self.pruning)!=dict):
+            return False
+        for k, v in self.pruning.items():
+            if (k not in ("band", "threshold", "seed")):
+                return False
+            if (v==None):
+                continue
+            if (k=="threshold"):
+                if (type(v) not in (int, float) or v<0):
+                    return False
+            elif (type(v)!=int or v<(0 if k=="band" else 1)):
+                return False
+        return True
+
+    def check_crossover(self):
+        return self.crossover==None or self.crossover in CROSSOVERS or type(self.crossover)==type
+
     def check_elitism(self):
         return (self.elitism>0.0 and self.elitism<=1.0)
 
@@ -102,8 +175,151 @@ class Descriptor:
            and self.check_possibilities() \
            and self.check_scoring() \
            and self.check_come_alpha() \
+           and self.check_encoding() \
+           and self.check_pruning() \
+           and self.check_crossover() \
            and self.check_elitism
     
+    def get_aligner(self):
+        """ Returns the alignment backend of this descriptor. """
+        try:
+            return self._aligner
+        except AttributeError:
+            self._aligner = get_aligner(self, self.alignment)
+            if (self.pruning!=None):
+                self._aligner = PrunedAligner(self, self._aligner, **self.pruning)
+            return self._aligner
+
+    def encode(self, s):
+        """ Converts a string of the alphabet into the chromosome encoding. """
+        if (self.encoding=="bytes" and type(s)==str):
+            return s.translate(self.get_codec()[0]).encode("latin-1")
+        return s
+
+    def decode(self, c):
+        """ Converts an encoded chromosome (or part of it) into a string. """
+        if (type(c)==bytes):
+            return c.decode("latin-1").translate(self.get_codec()[1])
+        return c
+
+    def get_codec(self):
+        """ Returns the translation tables between alphabet and indices. """
+        try:
+            return self._codec
+        except AttributeError:
+            self._codec = (dict(((ord(c), i) for i, c in enumerate(self.alphabet))),
+                           dict(((i, c) for i, c in enumerate(self.alphabet))))
+            return self._codec
+
+    def get_tokenizer(self):
+        """ Returns the chromosome tokenizer of this descriptor. """
+        try:
+            return self._tokenizer
+        except AttributeError:
+            self._tokenizer = Tokenizer(self)
+            return self._tokenizer
+
+    def get_mutator(self):
+        """ Returns the mutation engine of this descriptor. """
+        try:
+            return self._mutator
+        except AttributeError:
+            self._mutator = Mutator(self)
+            return self._mutator
+
+    def get_crossover(self):
+        """ Returns the crossover operator of this descriptor. """
+        try:
+            return self._crossover
+        except AttributeError:
+            self._crossover = get_crossover(self, self.crossover)
+            return self._crossover
+
+    def get_come(self):
+        """ Returns the CoME parameter decoder of this descriptor. """
+        try:
+            return self._come
+        except AttributeError:
+            self._come = CoME(self)
+            return self._come
+
+    def get_patterns(self):
+        """ Returns the compiled device and terminal/parameter patterns in
+            the chromosome encoding. """
+        try:
+            return self._patterns
+        except AttributeError:
+            markers = [[self.encode(d) for d in self.devices],
+                       [self.encode(self.terminal), self.encode(self.parameter)]]
+            if (self.encoding=="bytes"):
+                self._patterns = tuple((re.compile(b"|".join(m)) for m in markers))
+            else:
+                self._patterns = tuple((re.compile("|".join(m)) for m in markers))
+            return self._patterns
+
+    def get_intern_table(self):
+        """ Returns the table of interned chromosomes, mapping a chromosome
+            to its devices (see Genome.parse), or None if disabled. Entries
+            are dropped once no genome uses them anymore. """
+        if (not self.intern):
+            return None
+        try:
+            return self._intern
+        except AttributeError:
+            self._intern = WeakValueDictionary()
+            return self._intern
+
+    def get_alignment_cache(self):
+        """ Returns the cache of alignment scores, or None if disabled. """
+        if (self.alignment_cache==None or isinstance(self.alignment_cache, LRUCache)):
+            return self.alignment_cache
+        try:
+            return self._alignment_cache
+        except AttributeError:
+            self._alignment_cache = LRUCache(int(self.alignment_cache))
+            return self._alignment_cache
+
+    def get_params(self):
+        """ Returns the parameters of this descriptor as a dictionary, which
+            can be passed to Descriptor(**params) again. A shared alignment
+            cache is left out. """
+        params = {"alphabet": self.alphabet,
+                  "devices": self.devices,
+                  "terminal": self.terminal,
+                  "parameter": self.parameter,
+                  "possibilities": self.possibilities,
+                  "scoring": self.scoring,
+                  "come_alpha": self.come_alpha,
+                  "alignment": self.alignment if type(self.alignment)==str else None,
+                  "alignment_cache": self.alignment_cache if not isinstance(self.alignment_cache, LRUCache) else None,
+                  "pruning": self.pruning,
+                  "intern": self.intern,
+                  "encoding": self.encoding,
+                  "crossover": self.crossover if type(self.crossover)==str else None,
+                  "elitism": self.elitism}
+        return params
+
+    def fingerprint(self):
+        """ Returns a stable hash (hex string) of the settings which affect
+            how a genome is decoded, i.e. not the mutation possibilities,
+            caches and the like. It is computed once, and again after one
+            of these settings is assigned; settings changed in place (e.g.
+            devices.append()) are not noticed. """
+        try:
+            return self._fingerprint
+        except AttributeError:
+            settings = (self.alphabet, self.devices, self.terminal, self.parameter,
+                        self.scoring, self.come_alpha, self.encoding)
+            if (self.pruning!=None):
+                # approximate scoring changes the phenotype
+                settings += (sorted(self.pruning.items()),)
+            self._fingerprint = blake2b(repr(settings).encode("utf-8"), digest_size = 16).hexdigest()
+            return self._fingerprint
+
+    def __getstate__(self):
+        # caches and backends are rebuilt on demand
+        return dict(((k, v) for k, v in self.__dict__.items() if not k.startswith("_")))
+
     def __str__(self):
         return self.__repr__()
 
@@ -115,6 +331,12 @@ class Descriptor:
               +"           possibilities = "+repr(self.possibilities)+",\n" \
               +"           scoring = "+repr(self.scoring)+",\n" \
               +"           come_alpha = "+repr(self.come_alpha)+",\n" \
+              +"           alignment = "+repr(self.alignment)+",\n" \
+              +"           alignment_cache = "+repr(self.alignment_cache)+",\n" \
+              +"           pruning = "+repr(self.pruning)+",\n" \
+              +"           intern = "+repr(self.intern)+",\n" \
+              +"           encoding = "+repr(self.encoding)+",\n" \
+              +"           crossover = "+repr(self.crossover)+",\n" \
               +"           elitism = "+repr(self.elitism)+")"
 
 
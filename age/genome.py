@@ -16,19 +16,86 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 
-import re
 import random
+from array import array
+from hashlib import blake2b
+from timeit import default_timer
 
 from .descriptor import Descriptor
+from .come import CoME
+
+
+class ParameterBatch:
+    """ Parameters of several devices, which are decoded together when the
+        parameters of one of them are read first. """
+
+    __slots__ = ("come", "parameters", "values")
+
+    def __init__(self, come, parameters):
+        self.come = come
+        self.parameters = parameters
+        self.values = None
+
+    def get_values(self):
+        if (self.values==None):
+            self.values = self.come.decode_many(self.parameters)
+            self.parameters = None
+        return self.values
 
 
 class Device:
-    def __init__(self, genome, device, token):
-        self.genome = genome
+    # there are many devices, so they have no instance dictionary
+    __slots__ = ("desc", "device", "chromosome", "start", "end", "terminals",
+                 "raw_parameters", "_values", "_offset")
+
+    def __init__(self, genome, device, token, start = None, end = None):
+        # only the descriptor is kept, since devices may be shared between
+        # genomes (see Genome.parse)
+        self.desc = genome.desc
         self.device = device
-        self.token = token
+        # the token is kept as a part of its chromosome, not as a copy
+        self.chromosome = token
+        self.start = start if start!=None else 0
+        self.end = end if end!=None else len(token)
         self.terminals = []
-        self.parameters = []
+        # parameters in the chromosome encoding, and parallel to them their
+        # values (see 'values')
+        self.raw_parameters = []
+        # array of the values, or the ParameterBatch holding them at
+        # '_offset' until they are decoded
+        self._values = None
+        self._offset = 0
+
+    @property
+    def token(self):
+        return self.chromosome[self.start:self.end]
+
+    @property
+    def values(self):
+        """ Array of the decoded parameter values, decoded on first
+            access. """
+        values = self._values
+        if (type(values)!=array):
+            if (values!=None):
+                offset = self._offset
+                self._values = array("d", values.get_values()[offset:offset+len(self.raw_parameters)])
+            elif (len(self.raw_parameters)>0):
+                alpha = self.desc.come_alpha
+                self._values = array("d", [self.parameter_decode(p, alpha) for p in self.raw_parameters])
+            else:
+                return array("d")
+        return self._values
+
+    @property
+    def parameters(self):
+        """ List of (parameter, value) tuples. This is a copy, use
+            add_parameter() to add parameters. """
+        return list(zip(self.raw_parameters, self.values))
+
+    @parameters.setter
+    def parameters(self, parameters):
+        self.raw_parameters = [p for p, v in parameters]
+        self._values = array("d", [v for p, v in parameters])
 
     def __del_(self):
         pass
@@ -37,13 +104,16 @@ class Device:
         self.terminals.append(terminal)
 
     def add_parameter(self, parameter):
-        self.parameters.append((parameter, self.parameter_decode(parameter, self.genome.desc.come_alpha)))
+        values = self._values = self.values
+        self.raw_parameters.append(parameter)
+        values.append(self.parameter_decode(parameter, self.desc.come_alpha))
 
     def parameter_decode(self, parameter, alpha = 1.0):
         # use CoME
-        beta = float(len(self.genome.desc.alphabet))
-        return sum((self.genome.desc.alphabet.find(parameter[i])*pow(beta*alpha, -i) for i in range(len(parameter)))) / \
-               ((beta-1) * sum((pow(beta*alpha, -i) for i in range(len(parameter)))))
+        desc = self.desc
+        if (alpha==desc.come_alpha):
+            return desc.get_come().decode(parameter)
+        return CoME(desc, alpha).decode(parameter)
 
     def __eq__(self, y):
         if (type(y)==Device):
@@ -55,29 +125,112 @@ class Device:
         return not self.__eq__(self, y)
 
     def __len__(self):
-        return len(self.token)
+        return self.end-self.start
 
     def __str__(self):
-        return self.token
+        return self.desc.decode(self.token)
+
+
+class InternedDevices(list):
+    """ Devices of an interned chromosome (see Genome.parse). """
+
+    __slots__ = ("chromosome", "__weakref__")
+
+    def __init__(self, chromosome, devices):
+        list.__init__(self, devices)
+        self.chromosome = chromosome
+
+
+class ChromosomeList(list):
+    """ Chromosomes of a genome. Every change increments 'version', so the
+        genome notices chromosomes replaced directly (see Genome.devices). """
+
+    __slots__ = ("version",)
+
+    def __init__(self, chromosomes = ()):
+        list.__init__(self, chromosomes)
+        self.version = 0
+
+    def __reduce__(self):
+        return (ChromosomeList, (list(self),), (None, {"version": self.version}))
+
+def _changing(name):
+    method = getattr(list, name)
+    def change(self, *args):
+        self.version += 1
+        return method(self, *args)
+    change.__name__ = name
+    return change
+
+for _name in ("__setitem__", "__delitem__", "__iadd__", "__imul__", "append", "extend",
+              "insert", "pop", "remove", "clear", "sort", "reverse"):
+    setattr(ChromosomeList, _name, _changing(_name))
 
 
 class Genome:
+    __slots__ = ("desc", "_chromosomes", "_devices", "_version", "parsed")
+
     def __init__(self, **params):
         self.desc = params.get("desc", None)
         if (self.desc==None):
             self.desc = Descriptor(**params)
         else:
             assert type(self.desc)==Descriptor
-        assert self.desc.check()
-
-        self.chromosomes = params.get("chromosomes", [])
-        assert type(self.chromosomes)==list
-        for c in self.chromosomes:
-            assert self.desc.check_token(c)
-
-        self.devices = []
-        self.re_find_device = re.compile("|".join(self.desc.devices))
-        self.re_find_termparam = re.compile(self.desc.terminal+"|"+self.desc.parameter)
+        # chromosomes from a trusted source (in the encoding of a checked
+        # descriptor) are not checked again
+        trusted = params.get("trusted", False)
+        assert trusted or self.desc.check()
+
+        chromosomes = params.get("chromosomes", [])
+        assert isinstance(chromosomes, list)
+        self.chromosomes = chromosomes
+        if (not trusted):
+            for i, c in enumerate(self.chromosomes):
+                if (type(c)==str):
+                    c = self.chromosomes[i] = self.desc.encode(c)
+                assert self.desc.check_chromosome(c)
+
+        # list of all devices, None until parsed, and the version of the
+        # chromosomes it was built from (see 'devices')
+        self._devices = None
+        self._version = None
+        # parsed[i] is (chromosomes[i], devices of chromosomes[i]) or None if
+        # the chromosome was changed since the last parse
+        self.parsed = params.get("parsed", [])
+
+    @property
+    def chromosomes(self):
+        return self._chromosomes
+
+    @chromosomes.setter
+    def chromosomes(self, chromosomes):
+        # the list is copied, so its changes are counted
+        self._chromosomes = ChromosomeList(chromosomes)
+        self._devices = None
+
+    @property
+    def devices(self):
+        """ Devices of all chromosomes. The genome is parsed on first access
+            after a change (see mark_dirty; chromosomes replaced directly
+            are detected, too), parameters are decoded when they are read
+            (see Device.parameters). """
+        if (self._devices==None or self._version!=self._chromosomes.version):
+            self.parse()
+        return self._devices
+
+    @devices.setter
+    def devices(self, devices):
+        # the devices are kept until the chromosomes change
+        self._devices = devices
+        self._version = self._chromosomes.version
+
+    @property
+    def re_find_device(self):
+        return self.desc.get_patterns()[0]
+
+    @property
+    def re_find_termparam(self):
+        return self.desc.get_patterns()[1]
 
     def __del__(self):
         pass
@@ -92,17 +245,26 @@ class Genome:
             num_chromosomes = random.randrange(num_chromosomes[0], num_chromosomes[1])
         for i in range(num_chromosomes):
             length = random.randrange(len_chromosomes[0], len_chromosomes[1])
-            chromosome = ""
-            for j in range(length):
-                chromosome += random.choice(self.desc.alphabet)
-            self.chromosomes.append(chromosome)
+            chromosome = "".join((random.choice(self.desc.alphabet) for j in range(length)))
+            self.chromosomes.append(self.desc.encode(chromosome))
+        self._devices = None
 
     def add_chromosome(self, chromosome = ""):
-        assert self.desc.check_token(chromosome)
+        chromosome = self.desc.encode(chromosome)
+        assert self.desc.check_chromosome(chromosome)
         self.chromosomes.append(chromosome)
+        self.mark_dirty(len(self.chromosomes)-1)
 
     def remove_chromosome(self, chromosome):
-        self.chromosomes.remove(chromosome)
+        self.pop_chromosome(self.chromosomes.index(self.desc.encode(chromosome)))
+
+    def pop_chromosome(self, index = -1):
+        if (index<0):
+            index += len(self.chromosomes)
+        if (index<len(self.parsed)):
+            self.parsed.pop(index)
+        self._devices = None
+        return self.chromosomes.pop(index)
 
     def get_chromosome(self, index):
         return self.chromosomes[index] if index<len(self.chromosomes) else False
@@ -122,10 +284,63 @@ class Genome:
     def iter_devices(self):
         return self.devices.__iter__()
 
+    def num_devices(self):
+        """ Returns the number of devices, without building them if the
+            genome is not parsed yet. """
+        if (self._devices!=None and self._version==self._chromosomes.version):
+            return len(self._devices)
+        markers = self.desc.get_tokenizer().markers
+        return sum((len(markers(c)) for c in self.chromosomes))
+
+    def mark_dirty(self, index = None):
+        """ Marks chromosome 'index' (or all chromosomes) as changed, so the
+            next parse() (or access to the devices) parses it again. An
+            'index' beyond the parsed chromosomes only drops the device
+            list, e.g. after a chromosome was appended. """
+        self._devices = None
+        if (index==None):
+            self.parsed = []
+        elif (index<len(self.parsed)):
+            self.parsed[index] = None
+
     def parse(self):
-        self.devices = [] # reset device list
-        for c in self.chromosomes:
-            self.parse_chromosome(c)
+        """ Parses all chromosomes into devices. Chromosomes which did not
+            change since the last parse keep their devices. If the
+            descriptor interns chromosomes, a chromosome equal to an interned
+            one is replaced by it and shares its devices, which therefore
+            must not be modified. If timed, the time spent is added to the
+            tokenizer's 'seconds' (see age.stats). """
+        timed = self.desc._timed
+        if (timed):
+            start = default_timer()
+        table = self.desc.get_intern_table()
+        parsed = []
+        dirty = []
+        for i, c in enumerate(self.chromosomes):
+            entry = self.parsed[i] if i<len(self.parsed) else None
+            # a chromosome replaced without marking is detected, too
+            if (entry==None or entry[0] is not c):
+                devices = table.get(c) if table!=None else None
+                if (devices==None):
+                    dirty.append(i)
+                    entry = None
+                else:
+                    c = self.chromosomes[i] = devices.chromosome
+                    entry = (c, devices)
+            parsed.append(entry)
+        # parameters of all chromosomes are decoded at once
+        for i, devices in zip(dirty, self.make_devices([self.chromosomes[i] for i in dirty])):
+            c = self.chromosomes[i]
+            if (table!=None):
+                devices = table[c] = InternedDevices(c, devices)
+            parsed[i] = (c, devices)
+        self.parsed = parsed
+        self._devices = [] # reset device list
+        for c, devices in parsed:
+            self._devices.extend(devices)
+        self._version = self._chromosomes.version
+        if (timed):
+            self.desc.get_tokenizer().seconds += default_timer()-start
 
     def search_all(self, regex, s):
         matches = []
@@ -138,15 +353,31 @@ class Genome:
         return matches
 
     def parse_chromosome(self, chromosome):
-        matches = self.search_all(self.re_find_device, chromosome)
-        for i in range(len(matches)-1):
-            m1 = matches[i]
-            m2 = matches[i+1]
-            token = chromosome[m1.start():m2.start()-1]
-            self.devices.append(self.parse_device(m1.group(), token))
-        if (len(matches)>0):
-            token = chromosome[matches[-1].end()+1:]
-            self.devices.append(self.parse_device(matches[-1].group(), token))
+        """ Returns the list of devices found in 'chromosome'. """
+        return self.make_devices([chromosome])[0]
+
+    def make_devices(self, chromosomes):
+        """ Returns the lists of devices found in each of 'chromosomes'. The
+            parameters of all devices are decoded in one batch, once the
+            parameters of any of them are read. """
+        tokenize = self.desc.get_tokenizer().tokenize
+        tokens = [tokenize(c, True) for c in chromosomes]
+        batch = ParameterBatch(self.desc.get_come(), [p for t in tokens for d in t for p in d[3]])
+        result = []
+        k = 0
+        for c, t in zip(chromosomes, tokens):
+            devices = []
+            for device_str, (start, end), terminals, parameters in t:
+                device = Device(self, device_str, c, start, end)
+                device.terminals = terminals
+                if (len(parameters)>0):
+                    device.raw_parameters = parameters
+                    device._values = batch
+                    device._offset = k
+                k += len(parameters)
+                devices.append(device)
+            result.append(devices)
+        return result
 
     def parse_device(self, device_str, token):
         device = Device(self, device_str, token)
@@ -167,55 +398,76 @@ class Genome:
         return device
 
     def local_alignment_score(self, a, b):
-        # using smith-waterman algorithm
-        # similarity score function
-        def w(a, b, scoring = None):
-            if (scoring==None):
-                return -1 if (a==None or b==None or a!=b) else 2
-            else:
-                return scoring[a][b]
-
-        # let smaller string be a, since we dont store all lines
-        if (len(b)<len(a)):
-            a, b = b, a
-            
-        # calculate H score
-        # H[0] current line
-        # H[1] last line
-        H = [[],[]]
-        score = 0
-        for i in range(len(a)):
-            for j in range(len(b)):
-                if (i==0 or j==0):
-                    H[0].append(0)
-                else:
-                    h = max([0,                                           # empty suffix
-                             H[1][j-1]+w(a[i], b[j], self.desc.scoring),  # math/mismatch
-                             H[1][j]+w(a[i], None, self.desc.scoring),    # deletion
-                             H[0][j-1]+w(None, b[j], self.desc.scoring)]) # insertion
-                    if (h>score):
-                        score = h
-                    H[0].append(h)
-            # swap lines
-            H.reverse()
-        return score
+        # using smith-waterman algorithm, see age.alignment
+        return self.desc.get_aligner().score(a, b)
 
     def terminal_score(self, tA, tB):
         return 2.0*self.local_alignment_score(tA, tB)/(len(tA)+len(tB))
 
+    def interaction_matrix(self, terminal_index_a, terminal_index_b, default = None):
+        """ Returns the matrix M of terminal scores between all devices, with
+            M[i][j] = terminal_score(devices[i].terminals[terminal_index_a],
+                                     devices[j].terminals[terminal_index_b]).
+            If a device lacks the terminal, the entry is 'default'. All
+            alignments are done in one batch, identical terminals are only
+            aligned once. """
+        def terminal(d, i):
+            try:
+                return d.terminals[i]
+            except IndexError:
+                return None
+        tA = [terminal(d, terminal_index_a) for d in self.devices]
+        tB = [terminal(d, terminal_index_b) for d in self.devices]
+        uA = list(set((t for t in tA if t!=None)))
+        uB = list(set((t for t in tB if t!=None)))
+        pairs = [(a, b) for a in uA for b in uB]
+        scores = {}
+        for (a, b), s in zip(pairs, self.desc.get_aligner().score_many(pairs)):
+            scores[(a, b)] = 2.0*s/(len(a)+len(b))
+        return [[default if (a==None or b==None) else scores[(a, b)] for b in tB] for a in tA]
+
     def crossover_chromosomes(self, cA, cB):
-        return cA, cB
-        pA = random.randrange(len(cA))
-        pB = random.randrange(len(cB))
-        cA = cA[:pA]+cB[pB:]
-        cB = cB[:pB]+cA[pA:]
-        return (cA, cB) if random.getrandbits(1)==0 else (cB, cA)
+        """ Returns both children of the chromosomes 'cA' and 'cB', by the
+            crossover operator of the descriptor (see age.crossover). """
+        return self.desc.get_crossover().children(cA, cB)
+
+    def homologous_chromosomes(gA, gB):
+        """ Returns for each chromosome of gA the index of the chromosome of
+            gB sharing the most devices (by name) with it. On ties, e.g. for
+            chromosomes without devices, the same index is preferred. """
+        markers = gA.desc.get_tokenizer().markers
+        def count(chromosome):
+            counts = {}
+            for position, device in markers(chromosome):
+                counts[device] = counts.get(device, 0)+1
+            return counts
+        counts = [count(c) for c in gB.chromosomes]
+        partners = []
+        for i, c in enumerate(gA.chromosomes):
+            a = count(c)
+            def shared(j):
+                b = counts[j]
+                return (sum((min(n, b.get(device, 0)) for device, n in a.items())), j==i)
+            partners.append(max(range(len(counts)), key = shared))
+        return partners
 
     def crossover(gA, gB, return_genome = True):
+        """ Returns the child of both genomes. With possibility
+            "chromosome_crossover" a chromosome of gA is crossed over with
+            its homologous chromosome of gB (see homologous_chromosomes),
+            otherwise the child gets the chromosome of gA. """
         child_chromosomes = []
+        crossover = gA.desc.get_crossover()
+        p = gA.desc.possibilities.get("chromosome_crossover", 0.0) if gA.desc.possibilities else 0.0
+        partners = None
         # crossover chromosomes
         for i in range(min(len(gA.chromosomes), len(gB.chromosomes))):
-            child_chromosomes.append(gA.crossover_chromosomes(gA.chromosomes[i], gB.chromosomes[i])[0])
+            c = gA.chromosomes[i]
+            if (p>0.0 and random.random()<p):
+                if (partners==None):
+                    partners = gA.homologous_chromosomes(gB)
+                c = crossover.child(c, gB.chromosomes[partners[i]])
+            child_chromosomes.append(c)
         d = len(gA.chromosomes)-len(gB.chromosomes)
         # copy remaining chromosomes
         if (d<0):
@@ -225,7 +477,15 @@ class Genome:
             for i in range(len(gB.chromosomes), len(gA.chromosomes)):
                 child_chromosomes.append(gA.chromosomes[i])
         if (return_genome):
-            return Genome(chromosomes = child_chromosomes, desc = gA.desc)
+            # chromosomes inherited unchanged keep the devices of the parent
+            inherited = {}
+            for g in (gA, gB):
+                for entry in g.parsed:
+                    if (entry!=None):
+                        inherited[id(entry[0])] = entry
+            parsed = [inherited.get(id(c)) for c in child_chromosomes]
+            # the chromosomes of the parents were checked already
+            return Genome(chromosomes = child_chromosomes, desc = gA.desc, parsed = parsed, trusted = True)
         else:
             return child_chromosomes
 
@@ -243,86 +503,21 @@ class Genome:
 
     def mutate(self):
         """ This method applies all mutation types with specified possibilities
-            to the genome. """
-        
-        while (self.mutation_occurs("char_delete")):
-            i = random.randrange(len(self.chromosomes))
-            #print("char_delete:", i, len(self.chromosomes[i]))
-            if (len(self.chromosomes[i])<1):
-                continue
-            p = random.randrange(len(self.chromosomes[i]))
-            self.chromosomes[i] = self.chromosomes[i][:p]+self.chromosomes[i][p+1:]
-
-        while (self.mutation_occurs("char_insert")):
-            i = random.randrange(len(self.chromosomes))
-            #print("char_insert:", i, len(self.chromosomes[i]))
-            if (len(self.chromosomes[i])<1):
-                continue
-            p = random.randrange(len(self.chromosomes[i]))
-            c = random.choice(self.desc.alphabet)
-            self.chromosomes[i] = self.chromosomes[i][:p]+c+self.chromosomes[i][p:]
-
-        while (self.mutation_occurs("char_replace")):
-            i = random.randrange(len(self.chromosomes))
-            #print("char_replace:", i, len(self.chromosomes[i]))
-            if (len(self.chromosomes[i])<1):
-                continue
-            p = random.randrange(len(self.chromosomes[i]))
-            c = random.choice(self.desc.alphabet)
-            self.chromosomes[i] = self.chromosomes[i][:p]+c+self.chromosomes[i][p+1:]
-
-        while (self.mutation_occurs("frag_delete")):
-            i = random.randrange(len(self.chromosomes))
-            if (len(self.chromosomes[i])<2):
-                continue
-            p = random.randrange(len(self.chromosomes[i])-1)
-            l = random.randrange(1, len(self.chromosomes[i])-p)
-            self.chromosomes[i] = self.chromosomes[i][:p]+self.chromosomes[i][p+l:]
-
-        while (self.mutation_occurs("frag_move")):
-            i = random.randrange(len(self.chromosomes))
-            if (len(self.chromosomes[i])<2):
-                continue
-            p = (random.randrange(len(self.chromosomes[i])-1),
-                random.randrange(len(self.chromosomes[i])))
-            l = random.randrange(1, len(self.chromosomes[i])-p[0])
-            if (p[0]<p[1]):
-                self.chromosomes[i] = self.chromosomes[i][:p[0]]+self.chromosomes[i][p[0]+l:p[1]]+self.chromosomes[i][p[0]:p[0]+l]+self.chromosomes[i][p[1]:]
-            else:
-                self.chromosomes[i] = self.chromosomes[i][:p[1]]+self.chromosomes[i][p[0]:p[0]+l]+self.chromosomes[i][p[1]:p[1]]+self.chromosomes[i][p[0]:]
-
-        while (self.mutation_occurs("frag_copy")):
-            i = random.randrange(len(self.chromosomes))
-            if (len(self.chromosomes[i])<2):
-                continue
-            p = (random.randrange(len(self.chromosomes[i])-1),
-                random.randrange(len(self.chromosomes[i])))
-            l = random.randrange(1, len(self.chromosomes[i])-p[0])
-            seq = self.chromosomes[i][p[0]:p[0]+l]
-            self.chromosomes[i] = self.chromosomes[i][:p[1]]+seq+self.chromosomes[i][p[1]:]
-
-        while (self.mutation_occurs("device_insert")):
-            i = random.randrange(len(self.chromosomes))
-            p = random.randrange(len(self.chromosomes[i]))
-            l = random.randrange(max((int(0.2*len(self.chromosomes[i])), 5)))
-            d = random.choice(self.desc.devices)+"".join((random.choice(self.desc.alphabet) for i in range(l)))
-            self.chromosomes[i] = self.chromosomes[i][:p]+d+self.chromosomes[i][p:]
-
-        while (self.mutation_occurs("chromosome_delete")):
-            i = random.randrange(len(self.chromosomes))
-            self.chromosomes.pop(i)
-
-        while (self.mutation_occurs("chromosomes_copy")):
-            i = random.randrange(len(self.chromosomes))
-            self.chromosomes.append(self.chromosomes[i])
-
-        # remove empty chromosomes
-        try:
-            while (True):
-                self.chromosomes.remove("")
-        except ValueError:
-            pass
-            
+            to the genome (see age.mutation.Mutator). """
+        self.desc.get_mutator().mutate(self)
+
+    def fingerprint(self):
+        """ Returns a stable hash (hex string) of the chromosomes and the
+            descriptor, which identifies the phenotype of the genome. """
+        h = blake2b(self.desc.fingerprint().encode("ascii"), digest_size = 16)
+        for c in self.chromosomes:
+            if (type(c)==str):
+                c = c.encode("utf-8")
+            # length prefixed, so that chromosome boundaries are part of it
+            h.update(len(c).to_bytes(4, "little"))
+            h.update(c)
+        return h.hexdigest()
+
     def __eq__(self, y):
         if (type(y)!=Genome):
             return False
@@ -341,7 +536,7 @@ class Genome:
         #return len(self.chromosomes)
 
     def __str__(self):
-        return str(self.chromosomes)
+        return str([self.desc.decode(c) for c in self.chromosomes])
 
     def __getitem__(self, y):
         return self.chromosomes[y]
@@ -0,0 +1,201 @@
+# age/island.py
+#  pyAGE - A Python implementation of the Analog Genetic Encoding
+#  Copyright (C) 2010  Janosch Gräf
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+""" Island model: several populations evolve in their own processes and
+    exchange their best agents every few generations.
+
+    Between migrations the islands run independently. At a migration every
+    island sends its best agents to the driver, which passes them on along
+    the topology in a fixed order; the immigrants replace the worst agents
+    of an island. Agents are sent as (id, fitness, chromosomes) tuples.
+    Each island seeds the random module of its process from the seed of the
+    driver, so a run is reproducible if the fitness function is
+    deterministic. """
+
+import random
+import multiprocessing
+from .genome import Genome
+from .population import Agent, Population
+
+
+def pack(agent):
+    """ Returns the compact form of an agent sent between processes. """
+    return (agent.id, agent.fitness, list(agent.genome.chromosomes))
+
+def unpack(desc, packed):
+    id, fitness, chromosomes = packed
+    genome = Genome(desc = desc, chromosomes = chromosomes, trusted = True)
+    return Agent(desc, parent = id, fitness = fitness, genome = genome)
+
+
+def ring(index, count):
+    """ Island 'index' receives from its predecessor. """
+    return [(index-1)%count] if count>1 else []
+
+def fully_connected(index, count):
+    """ Island 'index' receives from all other islands. """
+    return [i for i in range(count) if i!=index]
+
+TOPOLOGIES = {"ring": ring,
+              "full": fully_connected}
+
+
+def _island(conn, index, seed, desc, eval_callback, size, evaluate, options):
+    """ Main loop of an island process. """
+    random.seed(seed)
+    population = Population(agedesc = desc, eval_callback = eval_callback, **options)
+    for i in range(size):
+        population.add(Agent(desc))
+    population.evaluate(evaluate)
+    while (True):
+        command, arg = conn.recv()
+        if (command=="evolve"):
+            generations, migrants = arg
+            for g in range(generations):
+                population.mate()
+                population.mutate()
+                population.evaluate(evaluate)
+            best = sorted(population.agents, key = lambda a: a.fitness, reverse = True)[:migrants]
+            conn.send([pack(a) for a in best])
+        elif (command=="migrate"):
+            if (len(arg)>0):
+                # immigrants replace the worst agents
+                worst = sorted(range(len(population.agents)), key = lambda i: population.agents[i].fitness)[:len(arg)]
+                for i, packed in zip(sorted(worst), arg):
+                    agent = unpack(desc, packed)
+                    agent.id = population.new_id()
+                    population.agents[i] = agent
+            conn.send(None)
+        elif (command=="collect"):
+            conn.send((population.generation, [pack(a) for a in population.agents]))
+        elif (command=="stop"):
+            conn.send(None)
+            break
+
+
+class Islands:
+    """ Driver of the island model.
+
+        'islands' populations of 'size' agents evolve in separate processes.
+        Every 'interval' generations each island sends its 'migrants' best
+        agents to the islands given by 'topology' ("ring", "full" or a
+        function (index, count) -> list of source islands). 'evaluate' is
+        passed to Population.evaluate (None evaluates all agents), further
+        options are passed to the populations. 'eval_callback' must be
+        picklable unless the processes are forked. """
+
+    def __init__(self, agedesc, eval_callback, islands = 4, size = 100, **options):
+        self.desc = agedesc
+        self.count = islands
+        self.size = size
+        self.topology = options.pop("topology", "ring")
+        if (type(self.topology)==str):
+            try:
+                self.topology = TOPOLOGIES[self.topology]
+            except KeyError:
+                raise ValueError("Unknown topology: "+repr(self.topology))
+        self.interval = options.pop("interval", 10)
+        self.migrants = options.pop("migrants", 2)
+        self.evaluate = options.pop("evaluate", None)
+        context = options.pop("context", None)
+        seed = options.pop("seed", None)
+        self.context = multiprocessing.get_context(context)
+        rng = random.Random(seed)
+        self.seeds = [rng.getrandbits(64) for i in range(islands)]
+        self.generation = 0
+        self.connections = []
+        self.processes = []
+        for i in range(islands):
+            parent, child = self.context.Pipe()
+            p = self.context.Process(target = _island, daemon = True,
+                                     args = (child, i, self.seeds[i], agedesc, eval_callback,
+                                             size, self.evaluate, options))
+            p.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(p)
+
+    def epoch(self, generations = None):
+        """ Evolves all islands for 'generations' (by default 'interval')
+            generations and migrates afterwards. Returns the best fitness of
+            every island. """
+        if (generations==None):
+            generations = self.interval
+        for c in self.connections:
+            c.send(("evolve", (generations, self.migrants)))
+        emigrants = [c.recv() for c in self.connections]
+        for i, c in enumerate(self.connections):
+            immigrants = []
+            for source in self.topology(i, self.count):
+                immigrants.extend(emigrants[source])
+            c.send(("migrate", immigrants))
+        for c in self.connections:
+            c.recv()
+        self.generation += generations
+        return [e[0][1] if len(e)>0 else None for e in emigrants]
+
+    def run(self, generations, callback = None):
+        """ Evolves all islands for 'generations' generations, migrating
+            every 'interval' generations. 'callback' is called with the
+            driver and the best fitness of every island after each
+            migration; if it returns True, the run stops early. """
+        done = 0
+        while (done<generations):
+            n = min(self.interval, generations-done)
+            best = self.epoch(n)
+            done += n
+            if (callback!=None and callback(self, best)):
+                break
+
+    def collect(self):
+        """ Returns the populations of all islands. """
+        for c in self.connections:
+            c.send(("collect", None))
+        populations = []
+        for c in self.connections:
+            generation, agents = c.recv()
+            population = Population(agedesc = self.desc, eval_callback = None, generation = generation)
+            for packed in agents:
+                agent = unpack(self.desc, packed)
+                agent.id, agent.parent = packed[0], None
+                population.add(agent)
+            populations.append(population)
+        return populations
+
+    def get_best(self):
+        return max((p.get_best() for p in self.collect()), key = lambda a: a.fitness)
+
+    def close(self):
+        for c, p in zip(self.connections, self.processes):
+            try:
+                c.send(("stop", None))
+                c.recv()
+            except (EOFError, OSError):
+                pass
+            c.close()
+            p.join()
+        self.connections = []
+        self.processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+__all__ = ["Islands"]
@@ -0,0 +1,225 @@
+# age/mutation.py
+#  pyAGE - A Python implementation of the Analog Genetic Encoding
+#  Copyright (C) 2010  Janosch Gräf
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import random
+from math import log
+
+
+# operators working within a single chromosome, in order of application
+CHROMOSOME_OPERATORS = ("char_delete", "char_insert", "char_replace",
+                        "frag_delete", "frag_move", "frag_copy",
+                        "device_insert")
+
+# all operators, in order of application
+OPERATORS = CHROMOSOME_OPERATORS+("chromosome_delete", "chromosome_copy")
+
+def geometric(p, rng = random):
+    """ Returns how often a mutation with possibility 'p' occurs in a row,
+        i.e. the number of iterations of 'while (rng.random()<p)', drawing a
+        single random number. """
+    if (p<=0.0):
+        return 0
+    if (p>=1.0):
+        raise ValueError("Mutation possibility must be less than 1: "+repr(p))
+    return int(log(1.0-rng.random())/log(p))
+
+def occurrences(p, n, rng = random):
+    """ Returns (i, count) for every i of 'n' independent draws of
+        geometric(p) which is not zero. Instead of drawing n times, the
+        distance to the next nonzero draw is drawn, which is geometric with
+        possibility 1-p, and its count is 1+geometric(p), since geometric()
+        is memoryless. So only about p*n draws are made. """
+    if (p<=0.0):
+        return []
+    if (p>=1.0):
+        raise ValueError("Mutation possibility must be less than 1: "+repr(p))
+    skip = log(1.0-p)
+    result = []
+    i = int(log(1.0-rng.random())/skip)
+    while (i<n):
+        result.append((i, 1+geometric(p, rng)))
+        i += 1+int(log(1.0-rng.random())/skip)
+    return result
+
+
+class Mutator:
+    """ Applies the mutations of a descriptor to genomes.
+
+        The number of occurrences of every mutation is drawn up front and the
+        chromosome-local mutations are grouped by chromosome. Each affected
+        chromosome is then converted into a mutable buffer once, all of its
+        mutations are applied in place and the buffer is joined once. The
+        mutations of a chromosome are applied in the same order and with the
+        same distributions as by a loop over the operators. """
+
+    def __init__(self, desc):
+        self.desc = desc
+        # chromosomes are edited as byte arrays if the alphabet allows
+        self.encoded = (desc.encoding=="bytes")
+        self.bytes = self.encoded or all((ord(c)<256 for c in desc.alphabet))
+        if (self.encoded):
+            self.symbols = list(range(len(desc.alphabet)))
+            self.devices = [bytearray(desc.encode(d)) for d in desc.devices]
+        elif (self.bytes):
+            self.symbols = list(desc.alphabet.encode("latin-1"))
+            self.devices = [bytearray(d, "latin-1") for d in desc.devices]
+        else:
+            self.symbols = list(desc.alphabet)
+            self.devices = [list(d) for d in desc.devices]
+        # number of operators applied and bases they touched, see age.stats
+        self.operations = 0
+        self.bases = 0
+
+    def possibility(self, name):
+        try:
+            return self.desc.possibilities[name]
+        except (KeyError, TypeError):
+            return 0.0
+
+    def events(self, num_chromosomes, rng = random, counts = None):
+        """ Returns a dictionary mapping chromosome indices to the list of
+            operators to apply to them. 'counts' maps operators to their
+            number of occurrences, if already drawn. """
+        events = {}
+        for name in CHROMOSOME_OPERATORS:
+            if (counts!=None):
+                n = counts.get(name, 0)
+            else:
+                n = geometric(self.possibility(name), rng)
+            for k in range(n):
+                events.setdefault(int(rng.random()*num_chromosomes), []).append(name)
+        return events
+
+    def mutate_chromosome(self, chromosome, operators, rng = random):
+        """ Returns 'chromosome' with all 'operators' applied. """
+        # int(rand()*n) is a cheaper randrange(n)
+        rand = rng.random
+        symbols = self.symbols
+        if (self.encoded):
+            buf = bytearray(chromosome)
+        else:
+            buf = bytearray(chromosome, "latin-1") if self.bytes else list(chromosome)
+        # bases touched
+        n = 0
+        for name in operators:
+            L = len(buf)
+            if (name=="char_delete"):
+                if (L<1):
+                    continue
+                del buf[int(rand()*L)]
+                n += 1
+            elif (name=="char_insert"):
+                if (L<1):
+                    continue
+                buf.insert(int(rand()*L), symbols[int(rand()*len(symbols))])
+                n += 1
+            elif (name=="char_replace"):
+                if (L<1):
+                    continue
+                buf[int(rand()*L)] = symbols[int(rand()*len(symbols))]
+                n += 1
+            elif (name=="frag_delete"):
+                if (L<2):
+                    continue
+                p = int(rand()*(L-1))
+                l = 1+int(rand()*(L-p-1))
+                del buf[p:p+l]
+                n += l
+            elif (name=="frag_move"):
+                if (L<2):
+                    continue
+                p = (int(rand()*(L-1)), int(rand()*L))
+                l = 1+int(rand()*(L-p[0]-1))
+                fragment = buf[p[0]:p[0]+l]
+                if (p[0]+l<=p[1]):
+                    del buf[p[0]:p[0]+l]
+                    buf[p[1]-l:p[1]-l] = fragment
+                elif (p[0]<p[1]):
+                    # target within the fragment, the overlap is doubled
+                    buf[p[0]:p[1]] = fragment
+                else:
+                    # the bases between target and fragment are replaced
+                    buf[p[1]:p[0]] = fragment
+                n += l
+            elif (name=="frag_copy"):
+                if (L<2):
+                    continue
+                p = (int(rand()*(L-1)), int(rand()*L))
+                l = 1+int(rand()*(L-p[0]-1))
+                buf[p[1]:p[1]] = buf[p[0]:p[0]+l]
+                n += l
+            elif (name=="device_insert"):
+                p = int(rand()*L)
+                l = int(rand()*max((int(0.2*L), 5)))
+                device = self.devices[int(rand()*len(self.devices))]
+                bases = [symbols[int(rand()*len(symbols))] for i in range(l)]
+                buf[p:p] = device+(bytearray(bases) if self.bytes else bases)
+                n += len(device)+l
+        self.operations += len(operators)
+        self.bases += n
+        if (self.encoded):
+            return bytes(buf)
+        return buf.decode("latin-1") if self.bytes else "".join(buf)
+
+    def mutate(self, genome, rng = random, counts = None):
+        """ Applies all mutations to 'genome'; see events() for 'counts'. """
+        chromosomes = genome.chromosomes
+        if (len(chromosomes)==0):
+            return
+
+        for i, operators in self.events(len(chromosomes), rng, counts).items():
+            chromosomes[i] = self.mutate_chromosome(chromosomes[i], operators, rng)
+            genome.mark_dirty(i)
+
+        def count(name):
+            if (counts!=None):
+                return counts.get(name, 0)
+            return geometric(self.possibility(name), rng)
+
+        for k in range(count("chromosome_delete")):
+            if (len(chromosomes)==0):
+                break
+            genome.pop_chromosome(rng.randrange(len(chromosomes)))
+
+        for k in range(count("chromosome_copy")):
+            if (len(chromosomes)==0):
+                break
+            i = rng.randrange(len(chromosomes))
+            chromosomes.append(chromosomes[i])
+            if (len(genome.parsed)==len(chromosomes)-1):
+                genome.parsed.append(genome.parsed[i])
+            genome.mark_dirty(len(chromosomes))
+
+        # remove empty chromosomes
+        for i in reversed(range(len(chromosomes))):
+            if (len(chromosomes[i])==0):
+                genome.pop_chromosome(i)
+
+    def mutate_many(self, genomes, rng = random):
+        """ Applies all mutations to each of 'genomes', with the same
+            distributions as mutate() on each of them. The occurrences of
+            every operator are drawn for all genomes at once (see
+            occurrences()), so genomes without mutations cost nothing. """
+        counts = {}
+        for name in OPERATORS:
+            for i, n in occurrences(self.possibility(name), len(genomes), rng):
+                counts.setdefault(i, {})[name] = n
+        for i in sorted(counts):
+            self.mutate(genomes[i], rng, counts[i])
+
+
+__all__ = ["Mutator", "geometric", "occurrences"]
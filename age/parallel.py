@@ -0,0 +1,203 @@
+# age/parallel.py
+#  pyAGE - A Python implementation of the Analog Genetic Encoding
+#  Copyright (C) 2010  Janosch Gräf
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import signal
+import time
+import multiprocessing
+from concurrent import futures
+from .genome import Genome
+
+
+class EvaluationTimeout(Exception):
+    pass
+
+
+class WorkerPopulation:
+    """ Passed to the fitness callback in a worker process instead of the
+        population, whose agents stay in the parent process. It carries the
+        descriptor 'agedesc' and the 'generation' of the population. """
+
+    def __init__(self, agedesc, generation = None):
+        self.agedesc = agedesc
+        self.generation = generation
+
+
+# state of a worker process, set up once by _init_worker
+_worker = {}
+
+def _init_worker(desc, callback, metadata, timeout):
+    _worker.update(desc = desc, callback = callback, metadata = metadata, timeout = timeout)
+    if (timeout!=None and hasattr(signal, "setitimer")):
+        def alarm(signum, frame):
+            raise EvaluationTimeout()
+        signal.signal(signal.SIGALRM, alarm)
+
+def _evaluate_chunk(chunk, generation = None):
+    """ Evaluates a list of chromosome lists in a worker process. Returns a
+        list of (fitness, metadata, timed out) tuples. """
+    # imported here to avoid a circular import
+    from .population import Agent
+    desc = _worker["desc"]
+    callback = _worker["callback"]
+    metadata = _worker["metadata"]
+    timeout = _worker["timeout"] if hasattr(signal, "setitimer") else None
+    population = WorkerPopulation(desc, generation)
+    results = []
+    for chromosomes in chunk:
+        # the descriptor was checked by the parent process
+        agent = Agent(desc, genome = Genome(desc = desc, chromosomes = chromosomes, trusted = True))
+        try:
+            if (timeout!=None):
+                signal.setitimer(signal.ITIMER_REAL, timeout)
+            try:
+                fitness = callback(population, agent)
+                if (type(fitness)==tuple):
+                    fitness = fitness[0]
+                results.append((fitness, metadata(agent) if metadata!=None else None, False))
+            finally:
+                if (timeout!=None):
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+        except EvaluationTimeout:
+            results.append((None, None, True))
+    return results
+
+
+class ProcessEvaluator:
+    """ Evaluates agents in a pool of worker processes.
+
+        Only the chromosomes of an agent are sent to the workers; the
+        descriptor, 'callback' and 'metadata' are sent once when the pool is
+        started. A worker builds the genome and calls callback(population,
+        agent), which returns the fitness of the agent. 'population' is a
+        WorkerPopulation, which only carries descriptor and generation. If
+        'metadata' is given, metadata(agent) is called afterwards in the
+        worker and its (picklable) result is stored in agent.metadata.
+
+        Agents are sent in chunks of 'chunksize'. An agent whose evaluation
+        takes longer than 'timeout' seconds is interrupted and gets the
+        fitness 'timeout_fitness'. The timeout is enforced by a timer in the
+        worker and, for workers which do not respond to it, by a deadline in
+        the parent, after which the pool is restarted. """
+
+    def __init__(self, callback, workers = None, chunksize = 1, timeout = None, **options):
+        self.callback = callback
+        self.workers = workers if workers!=None else (os.cpu_count() or 1)
+        self.chunksize = max(1, int(chunksize))
+        self.timeout = timeout
+        self.timeout_fitness = options.get("timeout_fitness", 0.0)
+        self.metadata = options.get("metadata")
+        # start method of the workers ("fork", "spawn", ...), None for default
+        self.context = options.get("context")
+        # extra time granted to a chunk before the parent gives up on it
+        self.grace = options.get("grace", 1.0)
+        self.executor = None
+        self.desc = None
+        self.timeouts = 0
+        self.timed_out = []
+
+    def start(self, desc):
+        """ Starts the pool for agents of descriptor 'desc'. """
+        if (self.executor!=None and self.desc is desc):
+            return
+        self.close()
+        context = multiprocessing.get_context(self.context) if self.context!=None else None
+        self.executor = futures.ProcessPoolExecutor(self.workers, context, _init_worker,
+                                                    (desc, self.callback, self.metadata, self.timeout))
+        self.desc = desc
+
+    def close(self, terminate = False):
+        """ Shuts the pool down; with 'terminate' running workers are
+            killed. """
+        if (self.executor==None):
+            return
+        if (terminate):
+            # the executor does not offer to kill its workers
+            processes = list((getattr(self.executor, "_processes", None) or {}).values())
+            self.executor.shutdown(wait = False, cancel_futures = True)
+            for p in processes:
+                p.terminate()
+        else:
+            self.executor.shutdown()
+        self.executor = None
+        self.desc = None
+
+    def evaluate(self, desc, agents, generation = None):
+        """ Evaluates 'agents' and sets their fitness (and metadata). Returns
+            the list of fitness values in the order of 'agents'; whether
+            each agent timed out is left in 'timed_out'. 'generation' is
+            passed on to the callback (see WorkerPopulation). """
+        agents = list(agents)
+        self.timed_out = []
+        if (len(agents)==0):
+            return []
+        n = self.chunksize
+        chunks = [agents[i:i+n] for i in range(0, len(agents), n)]
+        submitted = [self.submit(desc, c, generation) for c in chunks]
+        deadline = None
+        if (self.timeout!=None):
+            # chunks run concurrently on all workers
+            rounds = (len(chunks)+self.workers-1)//self.workers
+            deadline = time.monotonic()+rounds*n*self.timeout+self.grace
+        stalled = False
+        for chunk, future in zip(chunks, submitted):
+            try:
+                wait = None if deadline==None else max(0.0, deadline-time.monotonic())
+                results = future.result(wait)
+            except futures.TimeoutError:
+                stalled = True
+                results = [(None, None, True)]*len(chunk)
+            self.timed_out.extend(self.apply(chunk, results))
+        if (stalled):
+            self.close(True)
+        return [a.fitness for a in agents]
+
+    def submit(self, desc, agents, generation = None):
+        """ Starts the evaluation of 'agents' as a single task and returns its
+            future; pass its result to apply(). The timeout is only enforced
+            within the worker. """
+        self.start(desc)
+        return self.executor.submit(_evaluate_chunk, [list(a.genome.chromosomes) for a in agents], generation)
+
+    def apply(self, agents, results):
+        """ Sets fitness (and metadata) of 'agents' from the results of an
+            evaluation task. Returns for each agent whether it timed out. """
+        flags = []
+        for agent, (fitness, metadata, timed_out) in zip(agents, results):
+            if (timed_out):
+                self.timeouts += 1
+                fitness = self.timeout_fitness
+            agent.fitness = fitness
+            if (self.metadata!=None):
+                agent.metadata = metadata
+            flags.append(timed_out)
+        return flags
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["executor"] = None
+        state["desc"] = None
+        return state
+
+
+__all__ = ["ProcessEvaluator", "EvaluationTimeout", "WorkerPopulation"]
@@ -17,32 +17,21 @@
 
 from tarfile import TarFile, TarInfo
 from os.path import splitext
-from random import sample, random
+from random import sample
 from math import ceil
+import asyncio
+import inspect
 from .genome import *
+from .selection import RouletteWheel, get_selection
+from .cache import LRUCache
+from .stats import Stats, NULL_STATS
 
 """ This module provides classes for handling of whole population of AGE agents """
 
 def roulette_wheel(iterable, n = 1, key = lambda x: x):
     """ Implementation of a roulette wheel with specified possibilities. """
-    available = sorted(iterable, key = key, reverse = True)
-    if (len(available)<n):
-        raise ValueError("Not enough ("+str(n)+") elements in iterable ("+str(len(available))+")")
-    S = sum(map(key, available))
-    picked = []
-
-    while (len(picked)<n):
-        r = random()*S
-        for e in available:
-            f = key(e)
-            r -= f
-            if (r<=0.0):
-                picked.append(e)
-                available.remove(e)
-                S -= f
-                break
-
-    return picked
+    available = list(iterable)
+    return [available[i] for i in RouletteWheel(list(map(key, available))).pick(n)]
 
 def test_roulette_wheel():
     iterable = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
@@ -61,17 +50,26 @@ def test_roulette_wheel():
 
 
 class Agent:
+    # further attributes (e.g. metadata) are kept in the instance dictionary,
+    # which is only created when one is set
+    __slots__ = ("agedesc", "id", "parent", "genome", "fitness", "__dict__")
+
     def __init__(self, agedesc, **options):
         self.agedesc = agedesc
         self.id = options.get("id")
+        # id of the agent whose genome this one was derived from
+        self.parent = options.get("parent")
         if ("file" in options):
             # load from file (usually a member of a TAR file)
             self.load_from_file(options["file"])
         else:
             # create new agent
-            self.genome = Genome(desc = agedesc,
-                                 chromosomes = options.get("chromosomes", []))
-            if ("chromosomes" not in options):
+            if ("genome" in options):
+                self.genome = options["genome"]
+            else:
+                self.genome = Genome(desc = agedesc,
+                                     chromosomes = options.get("chromosomes", []))
+            if ("chromosomes" not in options and "genome" not in options):
                 # if no chromosomes given, generate some
                 self.genome.add_randomly((1, 3), (10, 200))
             self.fitness = options.get("fitness", 0)
@@ -92,12 +90,30 @@ class Agent:
         f.write(repr(self.id)+"\n")
         f.write(str(self.fitness)+"\n")
         for c in self.genome:
-            f.write(c+"\n")
+            f.write(self.agedesc.decode(c)+"\n")
 
 
 class Population:
     def __init__(self, **options):
         self.eval_callback = options["eval_callback"]
+        # e.g. a ProcessEvaluator, None to evaluate in this process
+        self.evaluator = options.get("evaluator")
+        # selection method used by mate(), see age.selection
+        self.selection = options.get("selection", "roulette")
+        self.selection_options = options.get("selection_options", {})
+        # memo of fitness values by genome fingerprint: maximum number of
+        # entries or an LRUCache, None to disable
+        self.fitness_cache = options.get("fitness_cache")
+        if (self.fitness_cache!=None and not isinstance(self.fitness_cache, LRUCache)):
+            self.fitness_cache = LRUCache(int(self.fitness_cache))
+        # noisy fitness functions bypass the fitness cache
+        self.noisy = options.get("noisy", False)
+        # id given to the next agent added without one
+        self.next_id = options.get("next_id", 0)
+        # instrumentation (see age.stats): True or a Stats object to enable
+        self.stats = options.get("stats") or NULL_STATS
+        if (self.stats is True):
+            self.stats = Stats()
         if ("file" in options):
             # load from file
             self.load_from_file(options["file"])
@@ -106,6 +122,7 @@ class Population:
             self.agedesc = options["agedesc"]
             self.generation = options.get("generation", 0)
             self.agents = []
+        self.stats.begin(self)
 
     def load_from_file(self, f):
         tar = TarFile(f, "r")
@@ -143,44 +160,186 @@ class Population:
 
         tar.close()                
 
+    def save_checkpoint(self, f, **options):
+        """ Writes the population to a checkpoint file (see age.checkpoint).
+            'options' are passed to CheckpointWriter. """
+        # imported here to avoid a circular import
+        from .checkpoint import save_checkpoint
+        save_checkpoint(f, self, **options)
+
+    def load_checkpoint(self, f):
+        """ Replaces descriptor, generation and agents by those of a
+            checkpoint file. """
+        from .checkpoint import CheckpointReader
+        with CheckpointReader(f) as reader:
+            self.agedesc = reader.desc
+            self.generation = reader.generation
+            self.agents = []
+            self.add(*reader)
+
+    def save_archive(self, f):
+        """ Writes the population to a memory mapped archive for analysis
+            (see age.archive). """
+        # imported here to avoid a circular import
+        from .archive import write_archive
+        write_archive(f, self)
+
+    def new_id(self):
+        id = self.next_id
+        self.next_id += 1
+        return id
+
+    def save_delta(self, writer):
+        """ Writes the current generation to a delta checkpoint, where
+            'writer' is an age.delta.DeltaWriter. """
+        writer.write(self)
+
     def add(self, *agents):
+        """ Adds agents; agents without an id get a new one. """
         for a in agents:
+            if (a.id==None):
+                a.id = self.new_id()
+            elif (type(a.id)==int and a.id>=self.next_id):
+                self.next_id = a.id+1
             self.agents.append(a)
 
     def remove(self, *agents):
         for a in agents:
             self.agents.remove(a)
 
-    def pick(self, n = 1, rwheel = False):
-        if (rwheel):
-            return roulette_wheel(self.agents, n, lambda a: a.fitness)
-        else:
+    def selector(self, method = None):
+        """ Builds a selection (see age.selection) over the current fitness
+            values, by default with the population's selection method. """
+        if (method==None):
+            method = self.selection
+        return get_selection(method, [a.fitness for a in self.agents], **self.selection_options)
+
+    def pick(self, n = 1, rwheel = False, method = None):
+        """ Picks 'n' distinct agents, uniformly or with the selection
+            'method' ('rwheel' selects by fitness with the default method).
+            'method' may also be a selection built by selector(). """
+        if (rwheel and method==None):
+            method = self.selection
+        if (method==None):
             return sample(self.agents, n)
+        if (not hasattr(method, "pick")):
+            method = self.selector(method)
+        picked = list(dict.fromkeys(method.pick(n)))
+        if (len(picked)<n):
+            # StochasticUniversal may pick an index several times, the
+            # missing agents are picked uniformly
+            picked += method.uniform(n-len(picked), picked)
+        return [self.agents[i] for i in picked]
 
     def mate(self):
-        n = min((2, ceil(self.agedesc.elitism*len(self.agents))))
-        elite = self.pick(n, True)
-        offspring = []
-        while (len(offspring)-len(elite)<len(self.agents)):
-            a, b = self.pick(2, True)
-            c = a.genome.crossover(b.genome, False)
-            offspring.append(Agent(self.agedesc, chromosomes = c))
-        self.agents = elite+offspring
-        self.generation += 1
+        """ Replaces the agents by the next generation. This finishes the
+            stats record of the current generation. """
+        self.stats.end_generation(self)
+        with self.stats.timer("mate"):
+            n = min((2, ceil(self.agedesc.elitism*len(self.agents))))
+            # the selection is built once for the whole generation
+            selection = self.selector()
+            elite = self.pick(n, method = selection)
+            offspring = []
+            for i, j in selection.pairs(len(self.agents)-len(elite)):
+                c = self.agents[i].genome.crossover(self.agents[j].genome)
+                offspring.append(Agent(self.agedesc, genome = c, id = self.new_id(), parent = self.agents[i].id))
+            self.agents = elite+offspring
+            self.generation += 1
 
     def mutate(self):
-        for a in self.agents:
-            a.genome.mutate()
+        """ Mutates all agents; the mutations of the whole population are
+            drawn at once (see age.mutation.Mutator.mutate_many). """
+        with self.stats.timer("mutate"):
+            self.agedesc.get_mutator().mutate_many([a.genome for a in self.agents])
 
-    def evaluate(self, n = 1):
-        agents = self.pick(n)
+    def lookup_fitness(self, agents):
+        """ Sets the fitness of all agents found in the fitness cache and
+            returns the others together with their fingerprints. """
+        cache = self.fitness_cache
+        if (cache==None or self.noisy):
+            return agents, None
+        missing = []
+        keys = []
         for a in agents:
-            a.genome.parse()
-        F = self.eval_callback(self, *agents)
+            key = a.genome.fingerprint()
+            fitness = cache.get(key)
+            if (fitness==None):
+                missing.append(a)
+                keys.append(key)
+            else:
+                a.fitness = fitness
+        return missing, keys
+
+    def store_fitness(self, agents, keys, timed_out = None):
+        """ Stores the fitness of 'agents' in the fitness cache, except for
+            those flagged in 'timed_out', whose fitness is a placeholder. """
+        if (keys!=None):
+            for i in range(len(agents)):
+                if (timed_out==None or not timed_out[i]):
+                    self.fitness_cache.put(keys[i], agents[i].fitness)
+
+    def evaluate(self, n = 1):
+        """ Evaluates 'n' randomly picked agents, or all agents if 'n' is
+            None. With an evaluator, each agent is evaluated on its own, and
+            the callback gets a WorkerPopulation (see age.parallel) instead
+            of this population. Agents found in the fitness cache are not passed to the
+            callback. Genomes are parsed on demand (see Genome.devices). """
+        agents = self.pick(n) if n!=None else list(self.agents)
+        agents, keys = self.lookup_fitness(agents)
+        if (len(agents)==0):
+            return
+        stats = self.stats
+        stats.count("evaluations", len(agents))
+        if (self.evaluator!=None):
+            with stats.timer("evaluate"):
+                self.evaluator.evaluate(self.agedesc, agents, self.generation)
+            self.store_fitness(agents, keys, getattr(self.evaluator, "timed_out", None))
+            return
+        # genomes are parsed when the callback reads their devices
+        with stats.timer("evaluate"):
+            F = self.eval_callback(self, *agents)
         if (type(F)!=tuple):
             F = (F,)
         for i in range(len(F)):
             agents[i].fitness = F[i]
+        self.store_fitness(agents[:len(F)], keys)
+
+    async def evaluate_async(self, n = 1, concurrency = None, timeout = None, timeout_fitness = 0.0):
+        """ Evaluates 'n' randomly picked agents (all if 'n' is None) with a
+            coroutine eval_callback(population, agent), one call per agent.
+            At most 'concurrency' calls run at the same time. A call which
+            takes longer than 'timeout' seconds is cancelled and its agent
+            gets 'timeout_fitness', which is not stored in the fitness
+            cache. """
+        agents = self.pick(n) if n!=None else list(self.agents)
+        agents, keys = self.lookup_fitness(agents)
+        self.stats.count("evaluations", len(agents))
+        limit = asyncio.Semaphore(concurrency) if concurrency!=None else None
+
+        async def evaluate(agent):
+            if (limit!=None):
+                async with limit:
+                    return await call(agent)
+            return await call(agent)
+
+        async def call(agent):
+            # returns the fitness and whether the call timed out
+            F = self.eval_callback(self, agent)
+            if (inspect.isawaitable(F)):
+                try:
+                    F = await asyncio.wait_for(F, timeout)
+                except asyncio.TimeoutError:
+                    return timeout_fitness, True
+            if (type(F)==tuple):
+                F = F[0]
+            return F, False
+
+        with self.stats.timer("evaluate"):
+            results = await asyncio.gather(*[evaluate(a) for a in agents])
+        for i in range(len(results)):
+            agents[i].fitness = results[i][0]
+        self.store_fitness(agents, keys, [r[1] for r in results])
 
     def get_best(self):
         return max(self.agents, key = lambda a: a.fitness)
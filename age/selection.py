@@ -0,0 +1,328 @@
+# age/selection.py
+#  pyAGE - A Python implementation of the Analog Genetic Encoding
+#  Copyright (C) 2010  Janosch Gräf
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+""" Fitness proportionate and tournament selection.
+
+    A selection is built once from the fitness values of a population (e.g.
+    once per generation) and then picks indices into that list. pick(n)
+    returns n distinct indices, like population.roulette_wheel; negative
+    fitness values count as zero and if all are zero, all indices are
+    equally likely. """
+
+import random
+
+
+class Selection:
+    """ Base class of the selection methods. """
+
+    def __init__(self, fitness, rng = random):
+        self.weights = [f if f>0.0 else 0.0 for f in fitness]
+        self.rng = rng
+
+    def __len__(self):
+        return len(self.weights)
+
+    def check(self, n):
+        if (len(self.weights)<n):
+            raise ValueError("Not enough ("+str(n)+") elements in iterable ("+str(len(self.weights))+")")
+
+    def pick(self, n = 1):
+        raise NotImplementedError()
+
+    def set(self, i, fitness):
+        """ Changes the fitness of index 'i', e.g. after replacing an agent
+            in steady-state evolution. """
+        raise NotImplementedError()
+
+    def pairs(self, m):
+        """ Returns 'm' pairs of distinct indices. """
+        return [tuple(self.pick(2)) for i in range(m)]
+
+    def uniform(self, n, exclude = ()):
+        """ Picks 'n' distinct indices uniformly, except those in 'exclude'. """
+        exclude = set(exclude)
+        return self.rng.sample([i for i in range(len(self.weights)) if i not in exclude], n)
+
+
+class RouletteWheel(Selection):
+    """ Fitness proportionate selection. Picking without replacement uses a
+        Fenwick tree (binary indexed tree) of the weights, so a pick and the
+        removal of the picked index take O(log n); picking with replacement
+        uses an alias table (Vose's method), built on first use, in O(1). """
+
+    def __init__(self, fitness, rng = random):
+        Selection.__init__(self, fitness, rng)
+        n = len(self.weights)
+        tree = [0.0]+self.weights
+        for i in range(1, n+1):
+            j = i+(i&-i)
+            if (j<=n):
+                tree[j] += tree[i]
+        self.tree = tree
+        self.total = sum(self.weights)
+        self.mask = 1
+        while (self.mask*2<=n):
+            self.mask *= 2
+        self.alias = None
+
+    def update(self, i, delta):
+        """ Adds 'delta' to the weight of index 'i'. """
+        tree = self.tree
+        i += 1
+        while (i<len(tree)):
+            tree[i] += delta
+            i += i&-i
+
+    def set(self, i, fitness):
+        w = fitness if fitness>0.0 else 0.0
+        self.update(i, w-self.weights[i])
+        self.total += w-self.weights[i]
+        self.weights[i] = w
+        self.alias = None
+
+    def find(self, r):
+        """ Returns the index at which the prefix sum of the weights exceeds
+            'r'. """
+        tree = self.tree
+        n = len(tree)-1
+        pos = 0
+        step = self.mask
+        while (step>0):
+            if (pos+step<=n and tree[pos+step]<=r):
+                pos += step
+                r -= tree[pos]
+            step //= 2
+        return pos
+
+    def pick(self, n = 1, replace = False):
+        self.check(n if not replace else min(n, 1))
+        if (replace):
+            return [self.pick_alias() for i in range(n)]
+        picked = []
+        removed = []
+        total = self.total
+        for k in range(n):
+            if (total<=0.0):
+                picked.extend(self.uniform(n-k, picked))
+                break
+            i = min(self.find(self.rng.random()*total), len(self.weights)-1)
+            if (self.weights[i]<=0.0 or i in picked):
+                # only possible through rounding of the prefix sums
+                i = max((j for j in range(len(self.weights)) if self.weights[j]>0.0 and j not in picked), default = None)
+                if (i==None):
+                    picked.extend(self.uniform(n-k, picked))
+                    break
+            picked.append(i)
+            # remove i until all picks are done
+            w = self.weights[i]
+            self.update(i, -w)
+            removed.append((i, w))
+            total -= w
+        for i, w in removed:
+            self.update(i, w)
+        return picked
+
+    def pairs(self, m):
+        """ Returns 'm' pairs of distinct indices. Both indices are drawn
+            from the alias table, the second one again while it equals the
+            first, which gives the distribution of pick(2) in O(1) per pair.
+            If the second index still equals the first after a few draws
+            (only if one weight dominates), it is drawn with the first one
+            removed (see pick_other). """
+        if (m==0):
+            return []
+        self.check(2)
+        if (self.total<=0.0):
+            return [tuple(self.pick(2)) for k in range(m)]
+        pick = self.pick_alias
+        pairs = []
+        for k in range(m):
+            i = pick()
+            for t in range(8):
+                j = pick()
+                if (j!=i):
+                    pairs.append((i, j))
+                    break
+            else:
+                pairs.append((i, self.pick_other(i)))
+        return pairs
+
+    def pick_other(self, i):
+        """ Picks an index other than 'i' by weight; the weight of 'i' is
+            removed from the tree for this draw. """
+        w = self.weights[i]
+        total = self.total-w
+        if (total<=0.0):
+            return self.uniform(1, (i,))[0]
+        self.update(i, -w)
+        j = min(self.find(self.rng.random()*total), len(self.weights)-1)
+        self.update(i, w)
+        if (self.weights[j]<=0.0 or j==i):
+            # only possible through rounding of the prefix sums
+            j = max((k for k in range(len(self.weights)) if self.weights[k]>0.0 and k!=i))
+        return j
+
+    def pick_alias(self):
+        if (self.alias==None):
+            self.alias = self.make_alias()
+        probability, alias = self.alias
+        x = self.rng.random()*len(probability)
+        i = int(x)
+        return i if x-i<probability[i] else alias[i]
+
+    def make_alias(self):
+        n = len(self.weights)
+        total = self.total
+        scaled = [w*n/total for w in self.weights] if total>0.0 else [1.0]*n
+        probability = [1.0]*n
+        alias = list(range(n))
+        small = [i for i in range(n) if scaled[i]<1.0]
+        large = [i for i in range(n) if scaled[i]>=1.0]
+        while (small and large):
+            s = small.pop()
+            l = large.pop()
+            probability[s] = scaled[s]
+            alias[s] = l
+            scaled[l] -= 1.0-scaled[s]
+            if (scaled[l]<1.0):
+                small.append(l)
+            else:
+                large.append(l)
+        return probability, alias
+
+
+class StochasticUniversal(Selection):
+    """ Stochastic universal sampling: n equally spaced pointers with a
+        single random offset are laid over the cumulative weights, so each
+        index is picked floor or ceil of its expected number of times.
+        Unlike the other methods pick(n) may return an index several times;
+        the picks are returned in random order. """
+
+    def __init__(self, fitness, rng = random):
+        Selection.__init__(self, fitness, rng)
+        self.cumulative = []
+        s = 0.0
+        for w in self.weights:
+            s += w
+            self.cumulative.append(s)
+        self.total = s
+
+    def set(self, i, fitness):
+        # the cumulative weights are rebuilt in O(n)
+        self.weights[i] = fitness if fitness>0.0 else 0.0
+        self.cumulative = []
+        s = 0.0
+        for w in self.weights:
+            s += w
+            self.cumulative.append(s)
+        self.total = s
+
+    def pick(self, n = 1):
+        self.check(min(n, 1))
+        if (self.total<=0.0):
+            return [self.rng.randrange(len(self.weights)) for i in range(n)]
+        cumulative = self.cumulative
+        step = self.total/n
+        r = self.rng.random()*step
+        picked = []
+        i = 0
+        for k in range(n):
+            while (i<len(cumulative)-1 and cumulative[i]<=r):
+                i += 1
+            picked.append(i)
+            r += step
+        self.rng.shuffle(picked)
+        return picked
+
+    def pairs(self, m):
+        """ Returns 'm' pairs out of 2m samples. The second index of a pair
+            of the same index is swapped with that of a few random other
+            pairs, until both pairs are distinct. """
+        picked = self.pick(2*m)
+        pairs = [[picked[2*i], picked[2*i+1]] for i in range(m)]
+        for i in range(m):
+            for t in range(8 if pairs[i][0]==pairs[i][1] else 0):
+                j = self.rng.randrange(m)
+                if (pairs[j][0]!=pairs[i][0] and pairs[j][1]!=pairs[i][0]):
+                    pairs[i][1], pairs[j][1] = pairs[j][1], pairs[i][1]
+                    break
+        return [tuple(p) for p in pairs]
+
+
+class Tournament(Selection):
+    """ Tournament selection: each pick is the fittest of 'size' indices
+        drawn uniformly from those not picked yet. Only the order of the
+        fitness values matters. """
+
+    def __init__(self, fitness, rng = random, size = 2):
+        Selection.__init__(self, fitness, rng)
+        self.fitness = list(fitness)
+        self.size = size
+
+    def set(self, i, fitness):
+        self.weights[i] = fitness if fitness>0.0 else 0.0
+        self.fitness[i] = fitness
+
+    def pick(self, n = 1):
+        self.check(n)
+        rng = self.rng
+        fitness = self.fitness
+        if (4*n<=len(fitness)):
+            # few picks: draw from all indices and draw again those already
+            # picked, which is uniform among the remaining ones, too
+            picked = []
+            for k in range(n):
+                best = None
+                for t in range(min(self.size, len(fitness)-k)):
+                    j = int(rng.random()*len(fitness))
+                    while (j in picked):
+                        j = int(rng.random()*len(fitness))
+                    if (best==None or fitness[j]>fitness[best]):
+                        best = j
+                picked.append(best)
+            return picked
+        remaining = list(range(len(fitness)))
+        picked = []
+        for k in range(n):
+            best = None
+            for t in range(min(self.size, len(remaining))):
+                j = rng.randrange(len(remaining))
+                if (best==None or fitness[remaining[j]]>fitness[remaining[best]]):
+                    best = j
+            picked.append(remaining[best])
+            # remove by swapping with the last one
+            remaining[best] = remaining[-1]
+            remaining.pop()
+        return picked
+
+
+SELECTIONS = {"roulette": RouletteWheel,
+              "sus": StochasticUniversal,
+              "tournament": Tournament}
+
+def get_selection(method, fitness, rng = random, **options):
+    """ Builds the selection 'method' (a name from SELECTIONS or a Selection
+        subclass) over the list of fitness values 'fitness'. """
+    if (type(method)==str):
+        try:
+            method = SELECTIONS[method]
+        except KeyError:
+            raise ValueError("Unknown selection method: "+repr(method))
+    return method(fitness, rng, **options)
+
+
+__all__ = ["Selection", "RouletteWheel", "StochasticUniversal", "Tournament", "get_selection"]
@@ -0,0 +1,202 @@
+# age/stats.py
+#  pyAGE - A Python implementation of the Analog Genetic Encoding
+#  Copyright (C) 2010  Janosch Gräf
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+""" Instrumentation of a population: named timers and counters, collected
+    into one record per generation.
+
+    Timers and explicit counters are kept by the Stats object of the
+    population. Work done below the population (alignments, mutations,
+    parsing, cache lookups) is counted by the objects of the descriptor
+    anyway, as plain attributes; these are only read when a record is
+    finished. Alignments and parsing are timed there too, once a Stats
+    object is used with the descriptor. Populations sharing a descriptor
+    therefore also share those counters, and work done in worker processes
+    (see age.parallel) is not counted. Disabled instrumentation is a
+    NullStats object, whose methods do nothing. """
+
+import time
+from timeit import default_timer
+
+from .cache import LRUCache
+
+
+class Timer:
+    """ Context manager adding its run time to a timer of 'stats'. """
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, *exc):
+        timers = self.stats.timers
+        timers[self.name] = timers.get(self.name, 0.0)+default_timer()-self.start
+
+
+class NullTimer:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+# counters of sample() holding seconds, reported as timers
+SAMPLED_TIMERS = {"alignment_seconds": "alignment",
+                  "parse_seconds": "parse"}
+
+def sample(population):
+    """ Returns the cumulative counters of the objects used by 'population'. """
+    desc = population.agedesc
+    counters = {}
+    # only objects already built are read, none is created here
+    aligner = getattr(desc, "_aligner", None)
+    if (aligner!=None):
+        counters["alignments"] = aligner.alignments
+        counters["alignment_seconds"] = aligner.seconds
+        if (hasattr(aligner, "skipped")):
+            counters["alignments_skipped"] = aligner.skipped
+            counters["alignments_stopped"] = aligner.stopped
+    tokenizer = getattr(desc, "_tokenizer", None)
+    if (tokenizer!=None):
+        counters["chromosomes_parsed"] = tokenizer.tokenized
+        counters["devices_parsed"] = tokenizer.found
+        counters["parse_seconds"] = tokenizer.seconds
+    mutator = getattr(desc, "_mutator", None)
+    if (mutator!=None):
+        counters["mutations"] = mutator.operations
+        counters["bases_mutated"] = mutator.bases
+    alignment_cache = desc.alignment_cache
+    if (not isinstance(alignment_cache, LRUCache)):
+        alignment_cache = getattr(desc, "_alignment_cache", None)
+    for name, cache in (("alignment_cache", alignment_cache),
+                        ("fitness_cache", population.fitness_cache)):
+        if (cache!=None):
+            counters[name+"_hits"] = cache.hits
+            counters[name+"_misses"] = cache.misses
+    return counters
+
+
+class Stats:
+    """ Instrumentation of a population. A record is finished by
+        end_generation() (called by Population.mate) and is a dictionary
+
+            generation   number of the generation
+            time         wall clock time when the record was finished
+            seconds      time since the previous record
+            timers       seconds spent per timer; "alignment" and
+                         "parse" are spent within the other timers,
+                         e.g. "evaluate"
+            counters     counts per counter
+
+        holding what happened since the previous record. 'callback' is
+        called with every finished record; the last 'keep' records (all if
+        None) are kept in 'records'. """
+
+    enabled = True
+
+    def __init__(self, callback = None, keep = None):
+        self.callback = callback
+        self.keep = keep
+        self.records = []
+        self.timers = {}
+        self.counters = {}
+        self.baseline = None
+        self.start = default_timer()
+
+    def timer(self, name):
+        """ Returns a context manager which adds its run time to timer
+            'name'. """
+        return Timer(self, name)
+
+    def count(self, name, n = 1):
+        self.counters[name] = self.counters.get(name, 0)+n
+
+    def begin(self, population):
+        """ Starts counting, if not already done. """
+        # the objects of the descriptor time their work from now on
+        population.agedesc._timed = True
+        if (self.baseline==None):
+            self.baseline = sample(population)
+            self.start = default_timer()
+
+    def end_generation(self, population):
+        """ Finishes the record of the current generation of 'population'
+            and returns it. """
+        population.agedesc._timed = True
+        current = sample(population)
+        baseline = self.baseline or {}
+        counters = dict(((k, v-baseline.get(k, 0)) for k, v in current.items()))
+        for k, v in self.counters.items():
+            counters[k] = counters.get(k, 0)+v
+        timers = self.timers
+        for k, name in SAMPLED_TIMERS.items():
+            if (k in counters):
+                timers[name] = timers.get(name, 0.0)+counters.pop(k)
+        now = default_timer()
+        record = {"generation": population.generation,
+                  "time": time.time(),
+                  "seconds": now-self.start,
+                  "timers": timers,
+                  "counters": counters}
+        self.baseline = current
+        self.start = now
+        self.timers = {}
+        self.counters = {}
+        self.records.append(record)
+        if (self.keep!=None and len(self.records)>self.keep):
+            del self.records[:len(self.records)-self.keep]
+        if (self.callback!=None):
+            self.callback(record)
+        return record
+
+    def get_last(self):
+        return self.records[-1] if len(self.records)>0 else None
+
+
+class NullStats:
+    """ Disabled instrumentation. """
+
+    enabled = False
+    records = []
+
+    _timer = NullTimer()
+
+    def timer(self, name):
+        return self._timer
+
+    def count(self, name, n = 1):
+        pass
+
+    def begin(self, population):
+        pass
+
+    def end_generation(self, population):
+        return None
+
+    def get_last(self):
+        return None
+
+
+NULL_STATS = NullStats()
+
+
+__all__ = ["Stats", "NullStats"]
@@ -0,0 +1,235 @@
+# age/steady.py
+#  pyAGE - A Python implementation of the Analog Genetic Encoding
+#  Copyright (C) 2010  Janosch Gräf
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+""" Steady-state evolution: instead of replacing the whole population at
+    once, every evaluated child replaces a single agent (the victim). With a
+    ProcessEvaluator a new child is submitted as soon as a result arrives,
+    so the workers never wait for the slowest agent of a generation. """
+
+import random
+import heapq
+import time
+from concurrent import futures
+from .population import Agent
+
+
+class VictimPolicy:
+    """ Chooses the agent replaced by a child. The policy is told about
+        every replacement, so it can keep its own bookkeeping. """
+
+    def __init__(self, population, rng = random):
+        self.population = population
+        self.rng = rng
+
+    def choose(self):
+        """ Returns the index of the next victim. """
+        raise NotImplementedError()
+
+    def replaced(self, i):
+        """ Called after agent 'i' was replaced. """
+        pass
+
+
+class WorstVictim(VictimPolicy):
+    """ Replaces the agent with the lowest fitness, kept in a heap with lazy
+        removal of replaced entries. """
+
+    def __init__(self, population, rng = random):
+        VictimPolicy.__init__(self, population, rng)
+        agents = population.agents
+        self.version = [0]*len(agents)
+        self.heap = [(a.fitness, i, 0) for i, a in enumerate(agents)]
+        heapq.heapify(self.heap)
+
+    def choose(self):
+        while (True):
+            fitness, i, version = self.heap[0]
+            if (version==self.version[i]):
+                return i
+            heapq.heappop(self.heap)
+
+    def replaced(self, i):
+        self.version[i] += 1
+        heapq.heappush(self.heap, (self.population.agents[i].fitness, i, self.version[i]))
+
+
+class OldestVictim(VictimPolicy):
+    """ Replaces the agents in the order they were inserted (FIFO). """
+
+    def __init__(self, population, rng = random):
+        VictimPolicy.__init__(self, population, rng)
+        self.next = 0
+
+    def choose(self):
+        return self.next
+
+    def replaced(self, i):
+        self.next = (i+1)%len(self.population.agents)
+
+
+class RandomVictim(VictimPolicy):
+
+    def choose(self):
+        return self.rng.randrange(len(self.population.agents))
+
+
+class TournamentVictim(VictimPolicy):
+    """ Replaces the worst of 'size' randomly drawn agents. """
+
+    def __init__(self, population, rng = random, size = 2):
+        VictimPolicy.__init__(self, population, rng)
+        self.size = size
+
+    def choose(self):
+        agents = self.population.agents
+        candidates = [self.rng.randrange(len(agents)) for i in range(self.size)]
+        return min(candidates, key = lambda i: agents[i].fitness)
+
+
+VICTIMS = {"worst": WorstVictim,
+           "oldest": OldestVictim,
+           "random": RandomVictim,
+           "tournament": TournamentVictim}
+
+
+class SteadyState:
+    """ Steady-state driver of a population whose agents are evaluated.
+
+        Parents are picked by the population's selection method, which is
+        built once and updated with every replacement. A child is the
+        crossover of both parents, mutated. 'victim' is a name from VICTIMS,
+        a VictimPolicy subclass or instance. Children are evaluated by the
+        population's evaluator (see age.parallel.ProcessEvaluator) with up
+        to 'concurrency' (by default twice the number of workers) children
+        in flight, or else one by one in this process. A child replaces its
+        victim when its result arrives and only if it is not worse, unless
+        'always_replace' is set. """
+
+    def __init__(self, population, victim = "worst", **options):
+        self.population = population
+        self.evaluator = options.get("evaluator", population.evaluator)
+        workers = getattr(self.evaluator, "workers", 1)
+        self.concurrency = options.get("concurrency", 2*workers)
+        self.always_replace = options.get("always_replace", False)
+        self.rng = options.get("rng", random)
+        if (type(victim)==str):
+            try:
+                victim = VICTIMS[victim]
+            except KeyError:
+                raise ValueError("Unknown victim policy: "+repr(victim))
+        if (type(victim)==type):
+            victim = victim(population, self.rng)
+        self.victim = victim
+        self.selection = population.selector()
+        self.evaluations = 0
+        self.replacements = 0
+
+    def breed(self):
+        """ Returns a new, mutated child of two selected parents. """
+        population = self.population
+        i, j = self.selection.pick(2)
+        a, b = population.agents[i], population.agents[j]
+        child = Agent(population.agedesc, genome = a.genome.crossover(b.genome),
+                      id = population.new_id(), parent = a.id)
+        child.genome.mutate()
+        return child
+
+    def insert(self, child):
+        """ Replaces the victim by the evaluated 'child'. Returns whether it
+            was replaced. """
+        self.evaluations += 1
+        population = self.population
+        i = self.victim.choose()
+        if (not self.always_replace and child.fitness<population.agents[i].fitness):
+            return False
+        population.agents[i] = child
+        self.selection.set(i, child.fitness)
+        self.victim.replaced(i)
+        self.replacements += 1
+        # a generation is as many replacements as there are agents
+        if (self.replacements%len(population.agents)==0):
+            population.stats.end_generation(population)
+            population.generation += 1
+        return True
+
+    def evaluate_serial(self, child):
+        population = self.population
+        population.stats.count("evaluations")
+        F = population.eval_callback(population, child)
+        child.fitness = F[0] if type(F)==tuple else F
+
+    def run(self, evaluations, callback = None):
+        """ Evaluates 'evaluations' children. 'callback' is called with the
+            driver and each evaluated child, also if its fitness was found
+            in the fitness cache; if it returns True, the run stops
+            (children in flight are discarded). Returns the number of
+            evaluations per second. """
+        population = self.population
+        start = time.monotonic()
+        done = 0
+        if (self.evaluator==None):
+            while (done<evaluations):
+                child = self.breed()
+                missing, keys = population.lookup_fitness([child])
+                if (len(missing)>0):
+                    self.evaluate_serial(child)
+                    population.store_fitness(missing, keys)
+                self.insert(child)
+                done += 1
+                if (callback!=None and callback(self, child)):
+                    break
+            return done/max(time.monotonic()-start, 1e-9)
+
+        desc = population.agedesc
+        pending = {}
+        submitted = 0
+        stop = False
+        while (done<evaluations and not stop):
+            # keep the workers busy
+            while (len(pending)<self.concurrency and submitted<evaluations):
+                child = self.breed()
+                submitted += 1
+                missing, keys = population.lookup_fitness([child])
+                if (len(missing)==0):
+                    # known fitness, no evaluation needed
+                    self.insert(child)
+                    done += 1
+                    if (callback!=None and callback(self, child)):
+                        stop = True
+                        break
+                    continue
+                population.stats.count("evaluations")
+                pending[self.evaluator.submit(desc, [child], population.generation)] = (child, keys)
+            if (stop):
+                break
+            if (len(pending)==0):
+                continue
+            finished, rest = futures.wait(list(pending), return_when = futures.FIRST_COMPLETED)
+            for future in finished:
+                child, keys = pending.pop(future)
+                timed_out = self.evaluator.apply([child], future.result())
+                population.store_fitness([child], keys, timed_out)
+                self.insert(child)
+                done += 1
+                if (callback!=None and callback(self, child)):
+                    stop = True
+        for future in pending:
+            future.cancel()
+        return done/max(time.monotonic()-start, 1e-9)
+
+
+__all__ = ["SteadyState", "VictimPolicy", "WorstVictim", "OldestVictim", "RandomVictim", "TournamentVictim"]
@@ -0,0 +1,120 @@
+# age/tokenizer.py
+#  pyAGE - A Python implementation of the Analog Genetic Encoding
+#  Copyright (C) 2010  Janosch Gräf
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import re
+
+
+class Tokenizer:
+    """ Splits chromosomes into devices, terminals and parameters.
+
+        The patterns are compiled once per descriptor. Genome.search_all
+        restarts each search one character after the end of the last match;
+        here every marker is followed by an optional extra character, so
+        that a single finditer() does the same within the regex engine. The
+        terminal and parameter markers of a device are found with one
+        finditer() within the bounds of its token, and the data in front of
+        each marker is sliced from the end of the previous match, so a
+        token is scanned once. The result is the same as that of
+        Genome.parse_device on the tokens found with Genome.search_all.
+        Tokens, terminals and parameters are returned in the chromosome
+        encoding, devices by their name in the descriptor. """
+
+    def __init__(self, desc):
+        self.desc = desc
+        encoded = (desc.encoding=="bytes")
+        # markers in the chromosome encoding; devices are reported by name
+        self.names = dict(((desc.encode(d), d) for d in desc.devices))
+        self.terminal = desc.encode(desc.terminal)
+        def escape(marker):
+            marker = desc.encode(marker)
+            return re.escape(marker.decode("latin-1") if encoded else marker)
+        devices = "|".join(map(escape, desc.devices))
+        termparam = escape(desc.terminal)+"|"+escape(desc.parameter)
+        patterns = ["(%s).?"%(devices,), "(%s).?"%(termparam,)]
+        if (encoded):
+            patterns = [p.encode("latin-1") for p in patterns]
+        self.re_device, self.re_termparam = [re.compile(p, re.S) for p in patterns]
+        # number of chromosomes tokenized and devices found, and seconds
+        # spent in Genome.parse, see age.stats
+        self.tokenized = 0
+        self.found = 0
+        self.seconds = 0.0
+
+    def markers(self, chromosome):
+        """ Returns (position, device) of the device markers in
+            'chromosome', as found by tokenize(). """
+        names = self.names
+        return [(m.start(), names[m.group(1)]) for m in self.re_device.finditer(chromosome)]
+
+    def tokenize(self, chromosome, offsets = False):
+        """ Returns a list of (device, token, terminals, parameters) tuples for
+            all devices in 'chromosome'. With 'offsets' the token is given
+            as its (start, end) in the chromosome instead. """
+        terminal = self.terminal
+        names = self.names
+        find_termparam = self.re_termparam.finditer
+        matches = [(m.start(), m.end(1), names[m.group(1)]) for m in self.re_device.finditer(chromosome)]
+        tokens = []
+        for i in range(len(matches)):
+            start, end, device = matches[i]
+            if (i<len(matches)-1):
+                # token includes the device marker
+                ts, te = start, matches[i+1][0]-1
+            else:
+                ts, te = end+1, len(chromosome)
+            terminals = []
+            parameters = []
+            first = True
+            p = ts
+            for m in find_termparam(chromosome, ts, te):
+                data = chromosome[p:m.start()]
+                marker = m.group(1)
+                p = m.end()
+                if (first and len(data)==0):
+                    # a match at the beginning of the token slices up to -1
+                    data = chromosome[ts:te-1]
+                else:
+                    # the base in front of a marker does not belong to the data
+                    data = data[:-1]
+                first = False
+                if (len(data)>0):
+                    if (marker==terminal):
+                        terminals.append(data)
+                    else:
+                        parameters.append(data)
+            tokens.append((device, (ts, te) if offsets else chromosome[ts:te], terminals, parameters))
+        self.tokenized += 1
+        self.found += len(tokens)
+        return tokens
+
+
+def test_tokenize_tail(length = 40000):
+    """ Tokenizes a device with a long tail without terminal and parameter
+        markers, which must take linear time. Returns the seconds taken. """
+    from timeit import default_timer
+    from .descriptor import Descriptor
+    desc = Descriptor(alphabet = "ACGT", devices = ["ACGA"], terminal = "TGC", parameter = "TGA")
+    assert desc.check()
+    chromosome = "ACGA"+"AAAATGCA"+"C"*length
+    start = default_timer()
+    tokens = Tokenizer(desc).tokenize(chromosome)
+    seconds = default_timer()-start
+    assert tokens==[("ACGA", chromosome[5:], ["AA"], [])]
+    return seconds
+
+
+__all__ = ["Tokenizer"]
@@ -39,6 +39,7 @@ desc = Descriptor(alphabet = "ACGT",  # We use a biology-like alphabet
                   terminal = "TT",   # Terminal marker
                   parameter = "GG",  # Parameter marker
                   elitism = 0.1,      # Elitism: 50%
+                  alignment_cache = 100000, # Cached terminal scores
                   # Mutation possibilities:
                   possibilities = {"char_delete": 0.009,
                                    "char_insert": 0.01,
@@ -66,6 +67,7 @@ class Network(pycann.Network):
         # init network
         pycann.Network.__init__(self, 2, max((0, len(genome.devices)-3)), 1)
         # configure neurons
+        scores = genome.interaction_matrix(0, 1)
         for i in range(len(genome.devices)):
             di = genome.devices[i]
             self.set_activation_function(i, activation_functions[di.device])
@@ -76,10 +78,9 @@ class Network(pycann.Network):
             self.set_threshold(i, t)
             for j in range(len(genome.devices)):
                 if (i!=j):
-                    dj = genome.devices[j]
-                    try:
-                        w = -1.0+4.0*genome.terminal_score(di.terminals[0], dj.terminals[1])
-                    except IndexError:
+                    if (scores[i][j]!=None):
+                        w = -1.0+4.0*scores[i][j]
+                    else:
                         w = 1.0
                     self.set_weight(i, j, w)
 